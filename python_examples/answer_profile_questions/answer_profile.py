@@ -10,10 +10,11 @@
 
 import os
 import json
-import requests
-from openpyxl import Workbook, load_workbook
 from tqdm import tqdm
-from utils import process_companies
+from metrics import metrics_option, phase
+from profiling import profile_option
+from telemetry import session, telemetry_option
+from utils import process_companies, read_records
 from glom import glom, Coalesce, OMIT
 
 import click
@@ -64,30 +65,37 @@ COMPANY_SCHEMA = {
     "--sheet", help="What sheet are we processing in the excel file?", required=False, default="Third Parties"
 )
 @click.argument("filename", required=False, default="profile-answers.xlsx")
+@metrics_option
+@telemetry_option
+@profile_option
 def answer_scoping_profile(sheet, filename):
     api = os.environ.get("CYBERGRX_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
     if not token:
         raise Exception("The environment variable CYBERGRX_API_TOKEN must be set")
 
-    wb = load_workbook(filename)
-    companies = process_companies(wb[sheet], HEADER_MAPPING, COMPANY_SCHEMA)
+    companies = process_companies(read_records(filename, HEADER_MAPPING, sheet), COMPANY_SCHEMA)
 
-    print("Detected " + str(len(companies)) + " companies with profile answers in " + filename)
-    for company in tqdm(companies, total=len(companies), desc="Third Party Profile"):
-        company_name = company.pop("name")
-        uri = api + "/v1/third-parties?limit=1&name=" + company_name
+    with phase("update") as count:
+        answered = 0
+        for company in tqdm(companies, desc="Third Party Profile"):
+            count()
+            answered += 1
+            company_name = company.pop("name")
+            uri = api + "/v1/third-parties?limit=1&name=" + company_name
 
-        response = requests.get(uri, headers={"Authorization": token.strip()})
-        result = json.loads(response.content.decode("utf-8"))
+            response = session.get(uri, headers={"Authorization": token.strip()})
+            result = json.loads(response.content.decode("utf-8"))
 
-        third_party_id = glom(result, "items.0.id", default=None)
-        if third_party_id:
-            uri = api + "/v1/third-parties/" + third_party_id + "/scoping"
-            response = requests.put(uri, headers={"Authorization": token.strip()}, json=company)
-            if response.status_code != 200:
-                print("Error submitting scoping profile answers for " + company_name)
-                print(response.content)
+            third_party_id = glom(result, "items.0.id", default=None)
+            if third_party_id:
+                uri = api + "/v1/third-parties/" + third_party_id + "/scoping"
+                response = session.put(uri, headers={"Authorization": token.strip()}, json=company)
+                if response.status_code != 200:
+                    print("Error submitting scoping profile answers for " + company_name)
+                    print(response.content)
+
+    print("Detected " + str(answered) + " companies with profile answers in " + filename)
 
 
 if __name__ == "__main__":
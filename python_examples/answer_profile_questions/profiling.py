@@ -0,0 +1,158 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import cProfile
+import functools
+import linecache
+import os
+import pstats
+import re
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import click
+from metrics import add_hook, remove_hook
+
+PROFILE_DIR = "profile"
+TOP_FUNCTIONS = 40
+TOP_LINES = 25
+
+# Call paths that account for less time than this are left out of the flame graph
+MIN_STACK_SECONDS = 0.000001
+
+
+def _filename(name):
+    return re.sub(r"[^\w.-]+", "-", name).strip("-") or "phase"
+
+
+def _label(func):
+    filename, lineno, name = func
+    if filename == "~":
+        return name.replace(";", ",")
+
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(";", ",")
+
+
+def collapsed_stacks(stats):
+    # cProfile only keeps caller -> callee totals, not whole stacks. Stacks are rebuilt by walking down from the
+    # functions nobody called, a function's time is split between the paths that lead to it by how much each caller
+    # spent calling it. The output is one "root;caller;function microseconds" line per path, as flamegraph.pl and
+    # speedscope expect
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    samples = {}
+    pending = [(func, (func,), entry[3]) for func, entry in stats.items() if not entry[4]]
+    while pending:
+        func, path, seconds = pending.pop()
+        total = stats[func][3]
+        share = min(seconds / total, 1) if total else 0
+        key = ";".join(_label(f) for f in path)
+        samples[key] = samples.get(key, 0) + stats[func][2] * share
+
+        for callee, edge_seconds in callees.get(func, []):
+            if callee in path or edge_seconds * share < MIN_STACK_SECONDS:
+                continue
+
+            pending.append((callee, path + (callee,), edge_seconds * share))
+
+    samples = [(key, round(seconds * 1000000)) for key, seconds in sorted(samples.items())]
+    return [f"{key} {microseconds}" for key, microseconds in samples if microseconds > 0]
+
+
+def _memory_lines(snapshot):
+    # Ignore the memory used by the profiler and tracemalloc themselves
+    snapshot = snapshot.filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__)]
+    )
+
+    lines = []
+    for stat in snapshot.statistics("lineno")[:TOP_LINES]:
+        frame = stat.traceback[0]
+        source = linecache.getline(frame.filename, frame.lineno).strip()
+        lines.append(
+            f"{stat.size / 1024:>12.1f} KiB {stat.count:>9} blocks  {frame.filename}:{frame.lineno}  {source}"
+        )
+
+    return lines
+
+
+def profiler():
+    # One profile per phase, a phase that runs more than once adds to the same profile. Memory is traced from the
+    # start of each call, the call with the highest peak is the one reported
+    phases = OrderedDict()
+
+    @contextmanager
+    def hook(name):
+        entry = phases.setdefault(name, {"profile": cProfile.Profile(), "peak": 0, "memory": []})
+        tracemalloc.start()
+        entry["profile"].enable()
+        try:
+            yield
+        finally:
+            entry["profile"].disable()
+            _, peak = tracemalloc.get_traced_memory()
+            if peak >= entry["peak"]:
+                entry["peak"] = peak
+                entry["memory"] = _memory_lines(tracemalloc.take_snapshot())
+            tracemalloc.stop()
+
+    def finalizer(profile_dir):
+        os.makedirs(profile_dir, exist_ok=True)
+
+        print("")
+        print(f"Profiles written to {profile_dir}")
+        for name, entry in phases.items():
+            path = os.path.join(profile_dir, _filename(name))
+            entry["profile"].dump_stats(f"{path}.pstats")
+
+            with open(f"{path}.txt", "w") as f:
+                stats = pstats.Stats(entry["profile"], stream=f)
+                stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+            with open(f"{path}.collapsed", "w") as f:
+                f.write("\n".join(collapsed_stacks(pstats.Stats(entry["profile"]).stats)) + "\n")
+
+            with open(f"{path}.memory.txt", "w") as f:
+                f.write(f"Peak traced memory {entry['peak'] / 1024 / 1024:.1f} MiB, memory still held at the end:\n")
+                f.write("\n".join(entry["memory"]) + "\n")
+
+            print(f"    {name}: peak {entry['peak'] / 1024 / 1024:.1f} MiB, {_filename(name)}.*")
+
+    hook.finalizer = finalizer
+    return hook
+
+
+def profile_option(command):
+    # Adds --profile to a click command, each outermost phase is profiled on its own while the command runs
+    @click.option(
+        "--profile",
+        help="Profile each phase with cProfile and tracemalloc, this slows the command down",
+        is_flag=True,
+        default=False,
+    )
+    @click.option("--profile-dir", help="Directory the profiles are written to", default=PROFILE_DIR)
+    @functools.wraps(command)
+    def wrapper(*args, profile=False, profile_dir=PROFILE_DIR, **kwargs):
+        if not profile:
+            return command(*args, **kwargs)
+
+        hook = profiler()
+        add_hook(hook)
+        try:
+            return command(*args, **kwargs)
+        finally:
+            remove_hook(hook)
+            hook.finalizer(profile_dir)
+
+    return wrapper
@@ -9,10 +9,11 @@
 #
 
 import os
+import csv
 import json
 import requests
 from collections import OrderedDict
-from openpyxl import Workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.styles.fills import FILL_SOLID
 from openpyxl.styles import Color, PatternFill, Font, Border, Side
 from openpyxl.styles import colors
@@ -21,8 +22,8 @@ from tqdm import tqdm
 from glom import glom
 
 
-def _cell_value(cell):
-    return "{}".format(cell.value).strip() if cell and cell.value else ""
+def _cell_value(value):
+    return "{}".format(value).strip() if value else ""
 
 
 def columns_for_headers(row, header_map):
@@ -36,28 +37,80 @@ def columns_for_headers(row, header_map):
     return mapping
 
 
-def process_companies(sheet, header_mapping, normalization):
-    companies = []
+def sheet_rows(filename, sheet):
+    # A read only workbook streams the sheet XML as it is iterated instead of loading every cell up front, and
+    # values_only yields each row as a tuple of plain values without building Cell objects
+    wb = load_workbook(filename, read_only=True)
+    try:
+        work_sheet = wb[sheet]
+        for row in work_sheet.iter_rows(values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+
+def delimited_rows(filename, delimiter):
+    # newline="" lets the csv module handle quoted values that span lines, utf-8-sig drops the BOM Excel writes
+    with open(filename, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            yield [value if value != "" else None for value in row]
+
+
+def table_records(rows, header_mapping):
+    # The first row with a known column header is the header row, every row after it becomes a record
     headers = {}
-    for index, row in enumerate(sheet.iter_rows()):
+    for row in rows:
         if not headers:
             headers = columns_for_headers(row, header_mapping)
-        else:
-            company = OrderedDict()
-            for column_index, col in enumerate(row):
-                if column_index not in headers:
-                    continue
-
-                if col.value is not None:
-                    try:
-                        company[headers[column_index]] = bytearray(col.value, "utf-8").decode("utf-8")
-                    except:
-                        company[headers[column_index]] = col.value
-
-            company = glom(company, normalization, default=None)
-            if not company:
+            continue
+
+        yield OrderedDict(
+            (headers[column_index], value)
+            for column_index, value in enumerate(row)
+            if column_index in headers and value is not None
+        )
+
+
+def jsonl_records(filename, header_mapping):
+    # Each line is an object keyed by the same column headers used in the spreadsheets
+    with open(filename, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
                 continue
 
-            companies.append(company)
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise Exception(f"Line {line_number} of {filename} is not valid JSON: {e}")
+
+            if not isinstance(record, dict):
+                raise Exception(f"Line {line_number} of {filename} is not a JSON object")
+
+            yield OrderedDict(
+                (header_mapping[_cell_value(header)], value)
+                for header, value in record.items()
+                if header_mapping.get(_cell_value(header)) and value is not None
+            )
+
+
+def read_records(filename, header_mapping, sheet=None):
+    # Spreadsheets, CSV, TSV and JSON lines are all streamed as records keyed by the mapped column names
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return table_records(delimited_rows(filename, ","), header_mapping)
+    if extension == ".tsv":
+        return table_records(delimited_rows(filename, "\t"), header_mapping)
+    if extension == ".jsonl":
+        return jsonl_records(filename, header_mapping)
+
+    return table_records(sheet_rows(filename, sheet), header_mapping)
+
+
+def process_companies(records, normalization):
+    # Companies are yielded as their records are read so lookups can start before the whole file has been parsed
+    for record in records:
+        company = glom(record, normalization, default=None)
+        if not company:
+            continue
 
-    return companies
+        yield company
@@ -0,0 +1,273 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import click
+from generator import write_ecosystem
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# Each exporter is run from its own directory's script, in an empty working directory
+EXPORTERS = OrderedDict(
+    [
+        ["bulk_excel_export", ["export.py"]],
+        ["bulk_xml_export", ["export.py"]],
+        ["excel_export_mapped_tags", ["export.py"]],
+        ["control_mapping_framework", ["export.py", "map-analytics", "--reports-from", "2016-01-01"]],
+    ]
+)
+
+# The control mapping framework needs its templates, they are not part of this repository
+TEMPLATES = {"control_mapping_framework": ["excel-template.xlsx", "report-template.docx"]}
+
+VENDOR_COUNTS = [1000, 10000, 50000]
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAX_RSS_BYTES = 1 if sys.platform == "darwin" else 1024
+
+
+def ecosystem_file(data_dir, vendors, options):
+    # Generated once per size and options, later runs reuse the file
+    os.makedirs(data_dir, exist_ok=True)
+    filename = os.path.join(data_dir, f"ecosystem-{vendors}-{'-'.join(f'{v}' for v in options.values())}.json")
+    if not os.path.exists(filename):
+        print(f"Generating {vendors} third parties into {filename}")
+        write_ecosystem(filename, vendors, **options)
+
+    return filename
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def local_server(script, args, options, description):
+    port = _free_port()
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, script), *args, "--port", f"{port}"]
+    for option, value in options.items():
+        command += [f"--{option.replace('_', '-')}", f"{value}"]
+
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.time() > deadline:
+                    raise Exception(f"The {description} did not start on port {port}")
+                time.sleep(0.1)
+
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+@contextmanager
+def mock_api(payload, mock_options):
+    with local_server("mock_api.py", [payload], mock_options, "mock API") as api:
+        yield api
+
+
+def _exit_code(status):
+    return -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+
+def run_process(command, workdir, env, timeout):
+    # The command writes its phase metrics to metrics.json in workdir, its output goes to output.log next to it
+    command = [*command, "--metrics-out", "metrics.json"]
+
+    # wait4 returns the resource usage of this one process, RUSAGE_CHILDREN would mix all of them together
+    timed_out = []
+    with open(os.path.join(workdir, "output.log"), "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+        def stop():
+            timed_out.append(True)
+            process.kill()
+
+        timer = threading.Timer(timeout, stop)
+        timer.start()
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        finally:
+            timer.cancel()
+        wall = time.perf_counter() - start
+        process.returncode = _exit_code(status)
+
+    if timed_out:
+        result = "timed out"
+    elif process.returncode:
+        result = f"failed ({process.returncode})"
+    else:
+        result = "ok"
+
+    phases = {}
+    if os.path.exists(os.path.join(workdir, "metrics.json")):
+        with open(os.path.join(workdir, "metrics.json")) as f:
+            phases = json.load(f)["phases"]
+
+    return {
+        "result": result,
+        "wall_seconds": wall,
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "max_rss_mib": usage.ru_maxrss * MAX_RSS_BYTES / 1024 / 1024,
+        "phases": phases,
+        "workdir": workdir,
+    }
+
+
+def run_exporter(name, vendors, api, python, timeout, template_dir):
+    workdir = tempfile.mkdtemp(prefix=f"{name}-{vendors}-")
+    for template in TEMPLATES.get(name, []):
+        shutil.copy(os.path.join(template_dir, template), workdir)
+
+    script, *args = EXPORTERS[name]
+    env = {**os.environ, "CYBERGRX_API": api, "CYBERGRX_BULK_API": api}
+    env.setdefault("CYBERGRX_API_TOKEN", "benchmark")
+
+    run = run_process([python, os.path.join(EXAMPLES_DIR, name, script), *args], workdir, env, timeout)
+    return {
+        "exporter": name,
+        "vendors": vendors,
+        **run,
+        "vendors_per_second": vendors / run["wall_seconds"] if run["result"] == "ok" and run["wall_seconds"] else None,
+    }
+
+
+def print_results(results):
+    print("")
+    print(
+        f"{'Exporter':<26}  {'Vendors':>8}  {'Result':<12}  {'Wall (s)':>10}  "
+        f"{'CPU (s)':>10}  {'RSS (MiB)':>10}  Vendors/s"
+    )
+    for r in results:
+        rate = f"{r['vendors_per_second']:.1f}" if r["vendors_per_second"] else "-"
+        print(
+            f"{r['exporter']:<26}  {r['vendors']:>8}  {r['result']:<12}  {r['wall_seconds']:>10.1f}  "
+            f"{r['cpu_seconds']:>10.1f}  {r['max_rss_mib']:>10.1f}  {rate}"
+        )
+
+
+@click.command()
+@click.option(
+    "--vendors",
+    "vendor_counts",
+    help="Ecosystem sizes to run, repeat for more",
+    multiple=True,
+    type=int,
+    default=VENDOR_COUNTS,
+)
+@click.option(
+    "--exporter",
+    "exporters",
+    help="Exporters to run, repeat for more, defaults to all of them",
+    multiple=True,
+    type=click.Choice(list(EXPORTERS)),
+)
+@click.option("--controls", help="Scored subcontrols per third party with a report", default=40, type=int)
+@click.option(
+    "--findings-density", help="Share of failed subcontrols that have a finding, 0 to 1", default=0.2, type=float
+)
+@click.option("--tags", help="Tags per third party", default=4, type=int)
+@click.option("--comment-size", help="Characters in each score comment, 0 for no comments", default=120, type=int)
+@click.option(
+    "--report-rate", help="Share of third parties with a residual risk report, 0 to 1", default=0.8, type=float
+)
+@click.option("--seed", help="Random seed for the generated ecosystems", default=0, type=int)
+@click.option("--latency", help="Mean seconds the mock API adds to every response", default=0.0, type=float)
+@click.option("--python", help="Python interpreter with the exporters' requirements", default=sys.executable)
+@click.option("--data-dir", help="Directory the generated ecosystems are kept in", default="data")
+@click.option(
+    "--template-dir",
+    help="Directory with excel-template.xlsx and report-template.docx for the control mapping framework",
+    default=os.path.join(EXAMPLES_DIR, "control_mapping_framework"),
+)
+@click.option("--timeout", help="Seconds before an exporter run is stopped", default=3600, type=int)
+@click.option("--output", help="Write the results to this JSON file", default="benchmark-results.json")
+@click.option(
+    "--keep-output", help="Keep the working directory of every run, failed runs are always kept", is_flag=True
+)
+def benchmark(
+    vendor_counts,
+    exporters,
+    controls,
+    findings_density,
+    tags,
+    comment_size,
+    report_rate,
+    seed,
+    latency,
+    python,
+    data_dir,
+    template_dir,
+    timeout,
+    output,
+    keep_output,
+):
+    exporters = list(exporters or EXPORTERS)
+    for name in [n for n in exporters if n in TEMPLATES]:
+        missing = [t for t in TEMPLATES[name] if not os.path.exists(os.path.join(template_dir, t))]
+        if missing:
+            print(f"Skipping {name}, {', '.join(missing)} not found in {template_dir}")
+            exporters.remove(name)
+
+    generator_options = OrderedDict(
+        [
+            ["controls", controls],
+            ["findings_density", findings_density],
+            ["tags", tags],
+            ["comment_size", comment_size],
+            ["report_rate", report_rate],
+            ["seed", seed],
+        ]
+    )
+
+    results = []
+    for vendors in vendor_counts:
+        payload = ecosystem_file(data_dir, vendors, generator_options)
+        with mock_api(payload, {"latency": latency}) as api:
+            for name in exporters:
+                print(f"Running {name} with {vendors} third parties")
+                result = run_exporter(name, vendors, api, python, timeout, template_dir)
+                results.append(result)
+
+                if result["result"] != "ok":
+                    print(f"    {result['result']}, see {os.path.join(result['workdir'], 'output.log')}")
+                elif not keep_output:
+                    shutil.rmtree(result["workdir"])
+
+        # Saved after every size so a long run that is stopped still has the results so far
+        with open(output, "w") as f:
+            f.write(json.dumps({"generator": generator_options, "latency": latency, "results": results}, indent=2))
+
+    print_results(results)
+
+
+if __name__ == "__main__":
+    benchmark()
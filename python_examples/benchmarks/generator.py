@@ -0,0 +1,232 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import json
+import random
+import uuid
+from datetime import date, timedelta
+
+import click
+from tqdm import tqdm
+
+# The shape of a /bulk-v1/third-parties record, every field read by TP_MAPPING, SCORE_MAPPING, GRX_COMPANY_SCHEMA and
+# the residual risk outcomes in the exporters is filled in
+RISK_LABELS = ["Very Low", "Low", "Moderate", "High", "Very High"]
+IMPACT_LEVELS = ["High", "Medium", "Low"]
+ANSWER_STATES = ["AnsweredYes", "AnsweredNo", "AnsweredPartial", "AnsweredNotApplicable"]
+VALIDATION_STATES = [
+    "FullyValidated",
+    "PartiallyValidated",
+    "NotValidated",
+    "PendingReview",
+    "NotSelectedForValidation",
+    None,
+]
+RESIDUAL_RISK_CATEGORIES = ["Data Loss", "Destructive Attack", "Disruptive Attack", "Fraud"]
+ASSESSMENT_STATES = ["Requested", "Pending", "In Progress", "Complete"]
+SUBSCRIPTION_STATES = ["New", "Ordered", "Active", "Expired"]
+INDUSTRIES = ["Technology", "Financial Services", "Healthcare", "Manufacturing", "Retail", "Energy", "Education"]
+TAG_PREFIXES = ["BU:", "VO:", "REG:", ""]
+TAG_VALUES = ["Finance", "HR", "IT", "Legal", "Marketing", "Operations", "Sales", "GDPR", "HIPAA", "PCI", "SOX"]
+WORDS = (
+    "access audit backup control data encryption incident logging monitor network patch policy review vendor".split()
+)
+
+# A control framework is a few domains of controls, the scored questions are the subcontrols
+CONTROLS_PER_DOMAIN = 4
+SUBCONTROLS_PER_CONTROL = 5
+COMMENT_POOL = 64
+
+
+def control_catalog(subcontrols):
+    # Numbered like the CyberGRX framework, subcontrol 3.2.1.4 belongs to control 3.2 in domain 3
+    catalog = []
+    per_domain = CONTROLS_PER_DOMAIN * SUBCONTROLS_PER_CONTROL
+    for d in range(1, (subcontrols - 1) // per_domain + 2):
+        catalog.append({"name": f"Domain {d}", "number": f"{d}", "question_type": "Domain"})
+        for c in range(1, CONTROLS_PER_DOMAIN + 1):
+            remaining = subcontrols - (d - 1) * per_domain - (c - 1) * SUBCONTROLS_PER_CONTROL
+            if remaining <= 0:
+                break
+
+            catalog.append(
+                {"name": f"Control {d}.{c}", "number": f"{d}.{c}", "question_type": "Control", "parent_number": f"{d}"}
+            )
+            for s in range(1, min(SUBCONTROLS_PER_CONTROL, remaining) + 1):
+                catalog.append(
+                    {
+                        "name": f"Subcontrol {d}.{c}.1.{s}",
+                        "number": f"{d}.{c}.1.{s}",
+                        "question_type": "SubControl",
+                        "parent_number": f"{d}.{c}",
+                    }
+                )
+
+    return catalog
+
+
+def comment_pool(rng, size):
+    # Comments are drawn from a small pool, building a fresh one for millions of scores would dominate the run
+    if size <= 0:
+        return [[]]
+
+    pool = []
+    for _ in range(COMMENT_POOL):
+        text = ""
+        while len(text) < size:
+            text += rng.choice(WORDS) + " "
+        pool.append([text[:size]])
+
+    return pool
+
+
+def score(rng, control, comments):
+    if control["question_type"] != "SubControl":
+        return {**control, "effectiveness_score": round(rng.uniform(0, 100), 2)}
+
+    answer_state = rng.choice(ANSWER_STATES)
+    scored = answer_state != "AnsweredNotApplicable"
+    return {
+        **control,
+        "answer_state": answer_state,
+        "effectiveness_score": round(rng.uniform(0, 100), 2) if scored else None,
+        "coverage_score": round(rng.uniform(0, 100), 2) if scored else None,
+        "maturity_score": round(rng.uniform(0, 100), 2) if scored else None,
+        "validation_state": rng.choice(VALIDATION_STATES),
+        "comments": rng.choice(comments),
+    }
+
+
+def risk(rng, prefix):
+    level = rng.randint(1, len(RISK_LABELS))
+    return {f"{prefix}_label": RISK_LABELS[level - 1], f"{prefix}_score": round(level + rng.random(), 2)}
+
+
+def residual_risk(rng, catalog, findings_density, comments, today):
+    scores = [score(rng, control, comments) for control in catalog]
+    findings = [
+        {
+            "name": s["name"],
+            "number": s["number"],
+            "impact_level": rng.choice(IMPACT_LEVELS),
+            "remedy": f"Implement {s['name']}, {rng.choice(comments)[0] if comments[0] else 'see the assessment'}",
+        }
+        for s in scores
+        if s.get("answer_state") in ["AnsweredNo", "AnsweredPartial"] and rng.random() < findings_density
+    ]
+
+    outcomes = []
+    for category in RESIDUAL_RISK_CATEGORIES:
+        inherent, residual = rng.randint(1, 5), rng.randint(1, 5)
+        outcomes.append(
+            {
+                "category": category,
+                "inherent_risk_label": RISK_LABELS[inherent - 1],
+                "inherent_risk_level": inherent,
+                "residual_risk_label": RISK_LABELS[residual - 1],
+                "residual_risk_level": residual,
+            }
+        )
+
+    return {
+        "id": f"{uuid.UUID(int=rng.getrandbits(128))}",
+        "report_type": "Residual Risk",
+        "date": (today - timedelta(days=rng.randint(0, 365))).isoformat(),
+        "tier": rng.choice([1, 2]),
+        "scores": scores,
+        "findings": findings,
+        "residual_risk_outcomes": outcomes,
+    }
+
+
+def third_party(rng, index, catalog, findings_density, tags, comments, report_rate, today):
+    name = f"Vendor {index} {rng.choice(WORDS).title()} Inc"
+    tier = rng.choice([1, 2, 3])
+    complete = rng.random() < report_rate
+    return {
+        "id": f"{uuid.UUID(int=rng.getrandbits(128))}",
+        "name": name,
+        "primary_url": f"https://vendor-{index}.example.com",
+        "industry": rng.choice(INDUSTRIES),
+        "custom_id": f"VENDOR-{index}" if rng.random() < 0.5 else None,
+        "custom_metadata": {"owner": rng.choice(TAG_VALUES), "contract": {"renewal": today.isoformat()}},
+        "tags": [f"{rng.choice(TAG_PREFIXES)}{rng.choice(TAG_VALUES)}" for _ in range(tags)],
+        "inherent_risk": {**risk(rng, "likelihood"), **risk(rng, "impact"), "recommended_report_tier": tier},
+        "assessment": {
+            "status": "Complete" if complete else rng.choice(ASSESSMENT_STATES[:-1]),
+            "progress": 100 if complete else rng.randint(0, 99),
+            "requested_completion_date": (today + timedelta(days=rng.randint(-90, 90))).isoformat(),
+            "completion_date": (today - timedelta(days=rng.randint(0, 365))).isoformat() if complete else None,
+        },
+        "subscription": {
+            "status": "Active" if complete else rng.choice(SUBSCRIPTION_STATES),
+            "tier": tier,
+            "is_report_available": complete,
+            "is_validated": complete and rng.random() < 0.5,
+            "is_profile_complete": rng.random() < 0.8,
+        },
+        "residual_risk": residual_risk(rng, catalog, findings_density, comments, today) if complete else None,
+    }
+
+
+def third_parties(
+    vendors, controls=40, findings_density=0.2, tags=4, comment_size=120, report_rate=0.8, seed=0, custom_ids=None
+):
+    # The same arguments and seed always produce the same ecosystem
+    rng = random.Random(seed)
+    catalog = control_catalog(controls)
+    comments = comment_pool(rng, comment_size)
+    today = date(2020, 1, 1)
+    for index in range(vendors):
+        tp = third_party(rng, index, catalog, findings_density, tags, comments, report_rate, today)
+        if custom_ids is not None:
+            # Linked to the rows of a sheet, such as the Smartsheet row IDs, the rest are not linked to anything
+            tp["custom_id"] = custom_ids[index] if index < len(custom_ids) else None
+        yield tp
+
+
+def write_ecosystem(filename, vendors, **kwargs):
+    # Written one vendor at a time so large ecosystems are never held in memory
+    with open(filename, "w") as f:
+        f.write("[")
+        for index, tp in enumerate(tqdm(third_parties(vendors, **kwargs), total=vendors, desc="Third Party")):
+            f.write(("," if index else "") + json.dumps(tp))
+        f.write("]")
+
+
+@click.command()
+@click.argument("filename", required=False, default="ecosystem.json")
+@click.option("--vendors", help="Number of third parties", default=1000, type=int)
+@click.option("--controls", help="Scored subcontrols per third party with a report", default=40, type=int)
+@click.option(
+    "--findings-density", help="Share of failed subcontrols that have a finding, 0 to 1", default=0.2, type=float
+)
+@click.option("--tags", help="Tags per third party", default=4, type=int)
+@click.option("--comment-size", help="Characters in each score comment, 0 for no comments", default=120, type=int)
+@click.option(
+    "--report-rate", help="Share of third parties with a residual risk report, 0 to 1", default=0.8, type=float
+)
+@click.option("--seed", help="Random seed", default=0, type=int)
+def generate(filename, vendors, controls, findings_density, tags, comment_size, report_rate, seed):
+    write_ecosystem(
+        filename,
+        vendors,
+        controls=controls,
+        findings_density=findings_density,
+        tags=tags,
+        comment_size=comment_size,
+        report_rate=report_rate,
+        seed=seed,
+    )
+    print(f"Wrote {vendors} third parties to {filename}")
+
+
+if __name__ == "__main__":
+    generate()
@@ -0,0 +1,200 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import click
+
+SUBSCRIPTION_STATES = ["New", "Ordered", "Active", None]
+THIRD_PARTY_PATH = re.compile(r"^/v1/third-parties/([^/]+)(/tagging|/scoping|/custom-id|/custom-metadata)?$")
+
+
+def third_party_record(name):
+    # Lookups find one third party, its ID and order state are derived from the name so repeated runs match
+    seed = uuid.uuid5(uuid.NAMESPACE_URL, name)
+    return {
+        "id": f"{seed}",
+        "name": name,
+        "primary_url": f"https://{re.sub('[^a-z0-9]+', '-', name.lower()).strip('-')}.example.com",
+        "custom_id": None,
+        "uri": f"/v1/third-parties/{seed}",
+        "subscription": {"status": SUBSCRIPTION_STATES[seed.int % len(SUBSCRIPTION_STATES)]},
+    }
+
+
+def endpoint(path):
+    match = THIRD_PARTY_PATH.match(path)
+    return f"/v1/third-parties/{{id}}{match.group(2) or ''}" if match else path
+
+
+def missed(name, miss_rate):
+    # Whether a name lookup misses is derived from the name as well, so every run creates the same third parties
+    return uuid.uuid5(uuid.NAMESPACE_URL, name).int % 1000 < miss_rate * 1000
+
+
+def mock_api_handler(
+    payload, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, miss_rate=0.0, seed=0
+):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    requests = {}
+
+    class MockApiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately, Nagle's algorithm would hold the body back on kept alive connections
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", f"{len(raw)}")
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def injected(self):
+            # Every endpoint waits for the configured latency, then fails a share of the requests
+            with lock:
+                key = f"{self.command} {endpoint(urlsplit(self.path).path)}"
+                requests[key] = requests.get(key, 0) + 1
+                wait = max(0.0, rng.gauss(latency, jitter)) if latency or jitter else 0.0
+                roll = rng.random()
+
+            if wait:
+                time.sleep(wait)
+
+            if roll < rate_limit_rate:
+                self.send_json(429, {"message": "Rate limit exceeded"}, {"Retry-After": f"{retry_after}"})
+                return True
+
+            if roll < rate_limit_rate + error_rate:
+                self.send_json(500, {"message": "Injected error"})
+                return True
+
+            return False
+
+        def read_body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length).decode("utf-8")) if length else None
+
+        def do_GET(self):
+            if self.injected():
+                return
+
+            url = urlsplit(self.path)
+            if url.path == "/bulk-v1/third-parties":
+                # Streamed from disk, the generated ecosystems can be larger than we want to hold in memory
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", f"{os.path.getsize(payload)}")
+                self.end_headers()
+                with open(payload, "rb") as f:
+                    shutil.copyfileobj(f, self.wfile, 1024 * 1024)
+                return
+
+            if url.path == "/v1/third-parties":
+                query = parse_qs(url.query)
+                name = query.get("name", query.get("domain", [""]))[0]
+                # A domain lookup only follows a missed name lookup, so with a miss rate it misses as well
+                miss = missed(name, miss_rate) if "name" in query else miss_rate > 0
+                self.send_json(200, {"items": [third_party_record(name)] if name and not miss else []})
+                return
+
+            match = THIRD_PARTY_PATH.match(url.path)
+            if match and not match.group(2):
+                self.send_json(200, {**third_party_record(match.group(1)), "id": match.group(1)})
+                return
+
+            self.send_json(404, {"message": f"{url.path} not found"})
+
+        def do_POST(self):
+            if self.injected():
+                return
+
+            body = self.read_body()
+            if urlsplit(self.path).path == "/v1/third-parties":
+                self.send_json(200, {**third_party_record((body or {}).get("name", "")), **(body or {})})
+                return
+
+            self.send_json(404, {"message": f"{self.path} not found"})
+
+        def do_PUT(self):
+            if self.injected():
+                return
+
+            body = self.read_body()
+            if THIRD_PARTY_PATH.match(urlsplit(self.path).path):
+                self.send_json(200, body or {})
+                return
+
+            self.send_json(404, {"message": f"{self.path} not found"})
+
+        do_PATCH = do_PUT
+
+    MockApiHandler.requests = requests
+    return MockApiHandler
+
+
+@click.command()
+@click.argument("payload", required=False, default="ecosystem.json")
+@click.option("--host", help="Address to listen on", default="127.0.0.1")
+@click.option("--port", help="Port to listen on", default=8080, type=int)
+@click.option("--latency", help="Mean seconds added to every response", default=0.0, type=float)
+@click.option("--jitter", help="Standard deviation of the added latency in seconds", default=0.0, type=float)
+@click.option("--error-rate", help="Share of requests that fail with a 500, 0 to 1", default=0.0, type=float)
+@click.option("--rate-limit-rate", help="Share of requests rate limited with a 429, 0 to 1", default=0.0, type=float)
+@click.option("--retry-after", help="Retry-After seconds sent with a 429", default=1, type=int)
+@click.option(
+    "--miss-rate", help="Share of third party lookups by name that find nothing, 0 to 1", default=0.0, type=float
+)
+@click.option("--seed", help="Random seed for the latency and injected errors", default=0, type=int)
+def serve(payload, host, port, latency, jitter, error_rate, rate_limit_rate, retry_after, miss_rate, seed):
+    if not os.path.exists(payload):
+        raise Exception(f"{payload} does not exist, create it with generator.py first.")
+
+    handler = mock_api_handler(payload, latency, jitter, error_rate, rate_limit_rate, retry_after, miss_rate, seed)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    # The benchmark stops the server with SIGTERM, exit through the finally below so the request counts are printed
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    print(
+        f"Serving {payload} on http://{host}:{server.server_port}, set CYBERGRX_API and CYBERGRX_BULK_API to it",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Requests served:")
+        for key, count in sorted(handler.requests.items()):
+            print(f"    {key}: {count}")
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,360 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import json
+import random
+import re
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import click
+
+# The columns smart_sheet_sync reads from a sheet and the GRX columns it writes back
+INPUT_COLUMNS = [
+    "Vendor Name",
+    "Vendor URL",
+    "Vendor HQ City",
+    "Vendor HQ Country",
+    "Vendor Owner",
+    "Description",
+    "Location",
+    "Vendor Contact Name",
+    "Vendor Contact First Name",
+    "Vendor Contact Last Name",
+    "Vendor Contact Email",
+    "Vendor Contact Phone",
+    "Order Assessment Tier",
+    "Critical/Support",
+    "RTO",
+    "Data Sensitivity",
+    "Legal/Regulatory Compliance",
+    "Technology Risk",
+    "Influence",
+    "Digital Identities",
+    "People",
+    "Data",
+    "Applications",
+    "Devices",
+    "Network Access",
+    "Facilities",
+    "Business Process",
+    "Ingest Date",
+]
+GRX_COLUMNS = [
+    "GRX Vendor Name",
+    "Impact",
+    "Likelihood",
+    "Industry",
+    "CyberGRX Inherent Risk Level",
+    "Is GRX Profile Complete",
+    "Is GRX Report Available",
+    "GRX Subscription Status",
+    "GRX Assessment Status",
+    "GRX Assessment Progress",
+    "GRX Assessment Completion Date",
+    "GRX Assessment Requested Date",
+    "Inherent Data Loss Score",
+    "Residual Data Loss Score",
+    "Inherent Disruptive Attack Score",
+    "Residual Disruptive Attack Score",
+    "Inherent Destructive Attack Score",
+    "Residual Destructive Attack Score",
+    "Inherent Fraud Score",
+    "Residual Fraud Score",
+]
+
+ANSWERS = ["Least", "Minimal", "Moderate", "Significant", None]
+ASSESSMENT_TIERS = ["Tier 1", "Tier 2", "Tier 2 Validated", "Tier 3", "No Assessment", None]
+CITIES = [["Denver", "United States"], ["London", "United Kingdom"], ["Toronto", "Canada"], ["Sydney", "Australia"]]
+FIRST_NAMES = ["Alex", "Jordan", "Sam", "Taylor", "Morgan", "Casey", "Riley", "Jamie"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Patel", "Nguyen", "Kim", "Brown", "Silva"]
+LEVELS = ["Low", "Medium", "High"]
+
+# Smartsheet IDs are large integers, the IDs here are fixed so a benchmark knows them before the server starts
+SHEET_ID_BASE = 4583173393803140
+COLUMN_ID_BASE = 7960873114331012
+ROW_ID_BASE = 2331373580117892
+
+# Smartsheet allows 300 requests per minute for each access token
+REQUESTS_PER_MINUTE = 300
+RATE_LIMIT_WINDOW = 60
+
+
+def sheet_id(index):
+    return SHEET_ID_BASE + index
+
+
+def row_id(sheet_index, index):
+    return ROW_ID_BASE + sheet_index * 1000000 + index
+
+
+def sheet_row(rng, sheet_index, index, columns, incomplete_rate, today):
+    city, country = rng.choice(CITIES)
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    domain = f"vendor-{index}.example.com"
+    values = {
+        "Vendor Name": f"Vendor {index} Inc",
+        "Vendor URL": domain if rng.random() < 0.9 else None,
+        "Vendor HQ City": city if rng.random() >= incomplete_rate else None,
+        "Vendor HQ Country": country,
+        "Vendor Owner": rng.choice(FIRST_NAMES),
+        "Description": f"Supplies {rng.choice(['hosting', 'payroll', 'analytics', 'support', 'logistics'])}",
+        "Location": city,
+        "Vendor Contact Name": f"{first} {last}",
+        "Vendor Contact Email": f"{first.lower()}.{last.lower()}@{domain}",
+        "Vendor Contact Phone": f"555-{rng.randint(1000, 9999)}",
+        "Order Assessment Tier": rng.choice(ASSESSMENT_TIERS),
+        "Critical/Support": rng.choice(["Critical", "Support"]),
+        "RTO": f"{rng.choice([4, 8, 24, 72])} hours",
+        "Data Sensitivity": rng.choice(LEVELS),
+        "Legal/Regulatory Compliance": rng.choice(["GDPR", "HIPAA", "PCI", "SOX", None]),
+        "Technology Risk": rng.choice(LEVELS),
+        "Influence": rng.choice(LEVELS),
+        "Digital Identities": rng.choice(ANSWERS),
+        "People": rng.choice(ANSWERS),
+        "Data": rng.choice(ANSWERS),
+        "Applications": rng.choice(ANSWERS),
+        "Devices": rng.choice(ANSWERS),
+        "Network Access": rng.choice(ANSWERS),
+        "Facilities": rng.choice(ANSWERS),
+        "Business Process": rng.choice(ANSWERS),
+        "Ingest Date": (today - timedelta(days=rng.randint(8, 365))).isoformat() if rng.random() < 0.2 else None,
+    }
+
+    # Like the Smartsheet API, empty cells are sent without a value
+    cells = []
+    for column in columns:
+        value = values.get(column["title"])
+        cell = {"columnId": column["id"]}
+        if value is not None:
+            cell.update({"value": value, "displayValue": f"{value}"})
+        cells.append(cell)
+
+    return {"id": row_id(sheet_index, index), "rowNumber": index + 1, "expanded": True, "cells": cells}
+
+
+def generate_sheet(sheet_index, rows, incomplete_rate=0.05, seed=0):
+    rng = random.Random(seed * 1000 + sheet_index)
+    titles = INPUT_COLUMNS + GRX_COLUMNS
+    columns = [
+        {"id": COLUMN_ID_BASE + i, "index": i, "title": title, "type": "TEXT_NUMBER", "primary": i == 0}
+        for i, title in enumerate(titles)
+    ]
+    today = date.today()
+    return {
+        "id": sheet_id(sheet_index),
+        "name": f"Vendors {sheet_index + 1}",
+        "version": 1,
+        "totalRowCount": rows,
+        "accessLevel": "OWNER",
+        "columns": columns,
+        "rows": [sheet_row(rng, sheet_index, index, columns, incomplete_rate, today) for index in range(rows)],
+    }
+
+
+def smartsheet_api_handler(sheets, latency=0.0, row_latency=0.0, requests_per_minute=REQUESTS_PER_MINUTE):
+    lock = threading.Lock()
+    recent = deque()
+    requests = {}
+
+    class SmartsheetApiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately, Nagle's algorithm would hold the body back on kept alive connections
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body):
+            raw = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+            self.send_header("Content-Length", f"{len(raw)}")
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def send_error_code(self, status, code, message):
+            self.send_json(status, {"errorCode": code, "message": message, "refId": uuid.uuid4().hex[:12]})
+
+        def api_path(self):
+            # The SDK prefixes every path with the API version of its api_base
+            return re.sub(r"^/2\.0", "", urlsplit(self.path).path)
+
+        def admitted(self, endpoint):
+            with lock:
+                requests[f"{self.command} {endpoint}"] = requests.get(f"{self.command} {endpoint}", 0) + 1
+                now = time.time()
+                while recent and recent[0] <= now - RATE_LIMIT_WINDOW:
+                    recent.popleft()
+
+                limited = requests_per_minute and len(recent) >= requests_per_minute
+                if not limited:
+                    recent.append(now)
+
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                self.send_error_code(401, 1002, "Your Access Token is invalid.")
+                return False
+
+            # Rate limited requests are answered right away, the SDK backs off and retries them
+            if limited:
+                self.send_error_code(429, 4003, "Rate limit exceeded.")
+                return False
+
+            return True
+
+        def wait(self, rows):
+            if latency or row_latency:
+                time.sleep(latency + row_latency * rows)
+
+        def do_GET(self):
+            path = self.api_path()
+            if path == "/sheets":
+                if not self.admitted("/sheets"):
+                    return
+
+                self.wait(0)
+                data = [{"id": s["id"], "name": s["name"], "accessLevel": s["accessLevel"]} for s in sheets.values()]
+                self.send_json(
+                    200,
+                    {"pageNumber": 1, "pageSize": len(data), "totalPages": 1, "totalCount": len(data), "data": data},
+                )
+                return
+
+            match = re.match(r"^/sheets/(\d+)$", path)
+            if not match:
+                self.admitted(path)
+                self.send_error_code(404, 1006, "Not Found")
+                return
+
+            if not self.admitted("/sheets/{id}"):
+                return
+
+            sheet = sheets.get(int(match.group(1)))
+            if not sheet:
+                self.send_error_code(404, 1006, "Not Found")
+                return
+
+            with lock:
+                body = json.dumps(sheet)
+            self.wait(len(sheet["rows"]))
+            raw = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+            self.send_header("Content-Length", f"{len(raw)}")
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_PUT(self):
+            path = self.api_path()
+            match = re.match(r"^/sheets/(\d+)/rows$", path)
+            length = int(self.headers.get("Content-Length", 0))
+            updates = json.loads(self.rfile.read(length).decode("utf-8")) if length else []
+            if not match:
+                self.admitted(path)
+                self.send_error_code(404, 1006, "Not Found")
+                return
+
+            if not self.admitted("/sheets/{id}/rows"):
+                return
+
+            sheet = sheets.get(int(match.group(1)))
+            if not sheet:
+                self.send_error_code(404, 1006, "Not Found")
+                return
+
+            if isinstance(updates, dict):
+                updates = [updates]
+
+            with lock:
+                rows = {row["id"]: row for row in sheet["rows"]}
+                columns = set(column["id"] for column in sheet["columns"])
+                missing = [u.get("id") for u in updates if u.get("id") not in rows]
+                unknown = [
+                    c.get("columnId") for u in updates for c in u.get("cells", []) if c.get("columnId") not in columns
+                ]
+                if not missing and not unknown:
+                    for update in updates:
+                        row = rows[update["id"]]
+                        cells = {cell["columnId"]: cell for cell in row["cells"]}
+                        for cell in update.get("cells", []):
+                            value = cell.get("value")
+                            cells[cell["columnId"]].update({"value": value, "displayValue": f"{value}"})
+                    sheet["version"] += 1
+                    result = [rows[u["id"]] for u in updates]
+
+            if missing:
+                self.send_error_code(404, 1006, f"Not Found: row {missing[0]}")
+                return
+
+            if unknown:
+                self.send_error_code(400, 1036, f"The columnId {unknown[0]} is invalid.")
+                return
+
+            self.wait(len(updates))
+            self.send_json(200, {"message": "SUCCESS", "resultCode": 0, "version": sheet["version"], "result": result})
+
+    SmartsheetApiHandler.requests = requests
+    return SmartsheetApiHandler
+
+
+@click.command()
+@click.option("--host", help="Address to listen on", default="127.0.0.1")
+@click.option("--port", help="Port to listen on", default=8081, type=int)
+@click.option("--rows", help="Rows in each generated sheet", default=1000, type=int)
+@click.option("--sheets", "sheet_count", help="Number of sheets to generate", default=1, type=int)
+@click.option(
+    "--incomplete-rate", help="Share of rows without a city, they are skipped by the sync", default=0.05, type=float
+)
+@click.option("--latency", help="Seconds added to every response", default=0.0, type=float)
+@click.option("--row-latency", help="Seconds added for each row read or updated", default=0.0, type=float)
+@click.option(
+    "--requests-per-minute",
+    help="Requests allowed per minute before a 429, 0 for no limit",
+    default=REQUESTS_PER_MINUTE,
+)
+@click.option("--seed", help="Random seed for the generated sheets", default=0, type=int)
+def serve(host, port, rows, sheet_count, incomplete_rate, latency, row_latency, requests_per_minute, seed):
+    sheets = {}
+    for index in range(sheet_count):
+        sheet = generate_sheet(index, rows, incomplete_rate, seed)
+        sheets[sheet["id"]] = sheet
+
+    handler = smartsheet_api_handler(sheets, latency, row_latency, requests_per_minute)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    # The benchmark stops the server with SIGTERM, exit through the finally below so the request counts are printed
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    print(
+        f"Serving {sheet_count} sheets of {rows} rows, set SMARTSHEET_API_BASE to http://{host}:{server.server_port}/2.0"
+    )
+    for sheet in sheets.values():
+        print(f"    {sheet['id']}: {sheet['name']}", flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Requests served:")
+        for key, count in sorted(handler.requests.items()):
+            print(f"    {key}: {count}")
+
+
+if __name__ == "__main__":
+    serve()
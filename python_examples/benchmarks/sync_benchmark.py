@@ -0,0 +1,210 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+
+import click
+from benchmark import EXAMPLES_DIR, local_server, mock_api, run_process
+from generator import write_ecosystem
+from smartsheet_api import REQUESTS_PER_MINUTE, row_id
+
+SYNC_SCRIPT = os.path.join(EXAMPLES_DIR, "smart_sheet_sync", "sync.py")
+SHEET_NAME = "Vendors 1"
+
+# bulk-import-request only reads the sheet, it runs first so sync-smart-sheet is the only one that updates it
+COMMANDS = ["bulk-import-request", "sync-smart-sheet"]
+
+# Smartsheet sheets are limited to 20,000 rows
+ROW_COUNTS = [1000, 5000, 20000]
+
+
+def sync_ecosystem_file(data_dir, rows, matched_rate, seed):
+    # The CyberGRX side of the sync, the first matched_rate of the rows are linked to a third party by their row ID.
+    # The sync reads the ecosystem without residual risk, so the third parties are generated without any scores.
+    os.makedirs(data_dir, exist_ok=True)
+    filename = os.path.join(data_dir, f"sync-ecosystem-{rows}-{matched_rate}-{seed}.json")
+    if not os.path.exists(filename):
+        print(f"Generating {rows} third parties into {filename}")
+        custom_ids = [f"{row_id(0, index)}" for index in range(int(rows * matched_rate))]
+        write_ecosystem(filename, rows, controls=0, comment_size=0, seed=seed, custom_ids=custom_ids)
+
+    return filename
+
+
+def telemetry_totals(workdir):
+    endpoints = {}
+    if os.path.exists(os.path.join(workdir, "telemetry.json")):
+        with open(os.path.join(workdir, "telemetry.json")) as f:
+            endpoints = json.load(f)["endpoints"]
+
+    return {
+        "requests": sum(e["requests"] for e in endpoints.values()),
+        "rate_limited": sum(e["statuses"].get("429", 0) for e in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+
+def run_sync_command(name, rows, api, smartsheet_api, python, workers, timeout):
+    workdir = tempfile.mkdtemp(prefix=f"{name}-{rows}-")
+    command = [python, SYNC_SCRIPT, name, "--sheet-name", SHEET_NAME, "--telemetry-out", "telemetry.json"]
+    if name == "sync-smart-sheet":
+        command += ["--workers", f"{workers}"]
+
+    env = {
+        **os.environ,
+        "CYBERGRX_API": api,
+        "CYBERGRX_BULK_API": api,
+        "SMARTSHEET_API_BASE": f"{smartsheet_api}/2.0",
+    }
+    env.setdefault("CYBERGRX_API_TOKEN", "benchmark")
+    env.setdefault("SMARTSHEET_ACCESS_TOKEN", "benchmark")
+
+    run = run_process(command, workdir, env, timeout)
+    return {
+        "command": name,
+        "rows": rows,
+        **run,
+        **telemetry_totals(workdir),
+        "rows_per_second": rows / run["wall_seconds"] if run["result"] == "ok" and run["wall_seconds"] else None,
+    }
+
+
+def print_sync_results(results):
+    print("")
+    print(
+        f"{'Command':<20}  {'Rows':>6}  {'Result':<12}  {'Wall (s)':>9}  {'CPU (s)':>8}  {'RSS (MiB)':>9}  "
+        f"{'Requests':>8}  {'429s':>5}  Rows/s"
+    )
+    for r in results:
+        rate = f"{r['rows_per_second']:.1f}" if r["rows_per_second"] else "-"
+        print(
+            f"{r['command']:<20}  {r['rows']:>6}  {r['result']:<12}  {r['wall_seconds']:>9.1f}  "
+            f"{r['cpu_seconds']:>8.1f}  {r['max_rss_mib']:>9.1f}  {r['requests']:>8}  {r['rate_limited']:>5}  {rate}"
+        )
+
+
+@click.command()
+@click.option(
+    "--rows", "row_counts", help="Sheet sizes to run, repeat for more", multiple=True, type=int, default=ROW_COUNTS
+)
+@click.option(
+    "--command",
+    "commands",
+    help="Commands to run, repeat for more, defaults to both",
+    multiple=True,
+    type=click.Choice(COMMANDS),
+)
+@click.option(
+    "--matched-rate",
+    help="Share of the rows already linked to a CyberGRX third party, 0 to 1",
+    default=0.5,
+    type=float,
+)
+@click.option(
+    "--miss-rate",
+    help="Share of the other rows not found by name in CyberGRX, so they are created",
+    default=0.5,
+    type=float,
+)
+@click.option("--incomplete-rate", help="Share of rows without a city, they are skipped", default=0.05, type=float)
+@click.option("--latency", help="Mean seconds the mock CyberGRX API adds to every response", default=0.0, type=float)
+@click.option(
+    "--smartsheet-latency", help="Seconds the Smartsheet stand-in adds to every response", default=0.0, type=float
+)
+@click.option(
+    "--row-latency", help="Seconds the Smartsheet stand-in adds for each row read or updated", default=0.0, type=float
+)
+@click.option(
+    "--requests-per-minute",
+    help="Smartsheet requests allowed per minute before a 429, 0 for no limit",
+    default=REQUESTS_PER_MINUTE,
+    type=int,
+)
+@click.option("--workers", help="Passed to sync-smart-sheet --workers", default=1, type=int)
+@click.option("--seed", help="Random seed for the generated sheet and ecosystem", default=0, type=int)
+@click.option("--python", help="Python interpreter with the smart_sheet_sync requirements", default=sys.executable)
+@click.option("--data-dir", help="Directory the generated ecosystems are kept in", default="data")
+@click.option("--timeout", help="Seconds before a command run is stopped", default=3600, type=int)
+@click.option("--output", help="Write the results to this JSON file", default="sync-benchmark-results.json")
+@click.option(
+    "--keep-output", help="Keep the working directory of every run, failed runs are always kept", is_flag=True
+)
+def sync_benchmark(
+    row_counts,
+    commands,
+    matched_rate,
+    miss_rate,
+    incomplete_rate,
+    latency,
+    smartsheet_latency,
+    row_latency,
+    requests_per_minute,
+    workers,
+    seed,
+    python,
+    data_dir,
+    timeout,
+    output,
+    keep_output,
+):
+    commands = [c for c in COMMANDS if c in (commands or COMMANDS)]
+    settings = OrderedDict(
+        [
+            ["matched_rate", matched_rate],
+            ["miss_rate", miss_rate],
+            ["incomplete_rate", incomplete_rate],
+            ["latency", latency],
+            ["smartsheet_latency", smartsheet_latency],
+            ["row_latency", row_latency],
+            ["requests_per_minute", requests_per_minute],
+            ["workers", workers],
+            ["seed", seed],
+        ]
+    )
+
+    results = []
+    for rows in row_counts:
+        payload = sync_ecosystem_file(data_dir, rows, matched_rate, seed)
+        smartsheet_options = {
+            "rows": rows,
+            "incomplete_rate": incomplete_rate,
+            "latency": smartsheet_latency,
+            "row_latency": row_latency,
+            "requests_per_minute": requests_per_minute,
+            "seed": seed,
+        }
+
+        # A fresh sheet for every size, sync-smart-sheet writes its updates back to it
+        with mock_api(payload, {"latency": latency, "miss_rate": miss_rate}) as api:
+            with local_server("smartsheet_api.py", [], smartsheet_options, "Smartsheet stand-in") as smartsheet_api:
+                for name in commands:
+                    print(f"Running {name} with {rows} rows")
+                    result = run_sync_command(name, rows, api, smartsheet_api, python, workers, timeout)
+                    results.append(result)
+
+                    if result["result"] != "ok":
+                        print(f"    {result['result']}, see {os.path.join(result['workdir'], 'output.log')}")
+                    elif not keep_output:
+                        shutil.rmtree(result["workdir"])
+
+        # Saved after every size so a long run that is stopped still has the results so far
+        with open(output, "w") as f:
+            f.write(json.dumps({"settings": settings, "results": results}, indent=2))
+
+    print_sync_results(results)
+
+
+if __name__ == "__main__":
+    sync_benchmark()
@@ -0,0 +1,229 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import csv
+import re
+import warnings
+from array import array
+from collections import namedtuple
+
+import numpy as np
+from glom import glom, Coalesce
+
+CONTROL_STATISTICS_TABLE = "Control Statistics"
+VENDOR_RANKINGS_TABLE = "Vendor Rankings"
+
+SCORE_FIELDS = [
+    ["Effectiveness", "effectiveness_score"],
+    ["Coverage", "coverage_score"],
+    ["Maturity", "maturity_score"],
+]
+PERCENTILES = [25, 50, 75]
+
+# Domain and control scores are rollups on a different scale, vendors are ranked on their subcontrol scores
+RANKED_QUESTION_TYPES = [None, "SubControl"]
+
+# The matrix holds float32 scores, 50,000 vendors by 1,500 controls is about 900 MB instead of 1.8 GB as float64.
+# Statistics are computed in float64 over slices of about this many scores so NumPy's temporary copies stay small.
+CHUNK_SCORES = 4 * 1024 * 1024
+
+ScoreMatrix = namedtuple("ScoreMatrix", ["vendors", "controls", "scores", "gaps"])
+
+
+def _natural_key(number):
+    return [(0, int(p), "") if p.isdigit() else (1, 0, p) for p in re.split(r"[.\s]+", f"{number}")]
+
+
+def _score(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+
+    return np.nan
+
+
+def _cell(value):
+    # NaN marks a missing score in the matrix, it is written as an empty cell.  Statistics of float32 scores are only
+    # good to 7 significant digits, they are written with that many
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(f"{value:.7g}")
+
+    if isinstance(value, np.integer):
+        return int(value)
+
+    return value
+
+
+def score_matrix_writer():
+    # Collect every vendor's scores and findings in the same pass that writes the long sheets, the vendor x control
+    # matrix is only allocated once all of the data has been seen
+    vendors = {}
+    controls = {}
+    control_names = {}
+    control_types = {}
+    # Typed arrays instead of lists, a Python object per score would take more memory than the matrix itself
+    score_rows, score_columns, score_values = array("l"), array("l"), array("f")
+    gap_rows, gap_columns = array("l"), array("l")
+
+    def control_index(item):
+        number = item.get("number")
+        if number not in controls:
+            controls[number] = len(controls)
+        if item.get("name") and number not in control_names:
+            control_names[number] = item["name"]
+        if item.get("question_type") and number not in control_types:
+            control_types[number] = item["question_type"]
+
+        return controls[number]
+
+    def writer(tp):
+        vendor = vendors.setdefault(tp["id"], (len(vendors), tp["name"]))[0]
+
+        for score in glom(tp, Coalesce("residual_risk.scores", default=[])):
+            score_rows.append(vendor)
+            score_columns.append(control_index(score))
+            score_values.extend(_score(score.get(field)) for _, field in SCORE_FIELDS)
+
+        for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
+            gap_rows.append(vendor)
+            gap_columns.append(control_index(finding))
+
+    def finalizer():
+        numbers = sorted(controls, key=_natural_key)
+        position = np.empty(len(numbers), dtype=np.intp)
+        for i, number in enumerate(numbers):
+            position[controls[number]] = i
+
+        scores = np.full((len(vendors), len(numbers), len(SCORE_FIELDS)), np.nan, dtype=np.float32)
+        if score_values:
+            values = np.asarray(score_values, dtype=np.float32).reshape(-1, len(SCORE_FIELDS))
+            scores[np.asarray(score_rows), position[np.asarray(score_columns)]] = values
+            del values
+
+        gaps = np.zeros((len(vendors), len(numbers)), dtype=bool)
+        if gap_rows:
+            gaps[np.asarray(gap_rows), position[np.asarray(gap_columns)]] = True
+
+        # The scores are in the matrix now, the collected values are released before the statistics are computed
+        for collected in [score_rows, score_columns, score_values, gap_rows, gap_columns]:
+            del collected[:]
+
+        return ScoreMatrix(
+            vendors=[(vendor_id, name) for vendor_id, (_, name) in vendors.items()],
+            controls=[(number, control_names.get(number), control_types.get(number)) for number in numbers],
+            scores=scores,
+            gaps=gaps,
+        )
+
+    writer.finalizer = finalizer
+    return writer
+
+
+def control_statistics_columns():
+    columns = [
+        ["Control Number", "number", "blue"],
+        ["Control Name", "name", "blue"],
+        ["Question Type", "question_type", "blue"],
+        ["Vendors Scored", "vendors_scored", "orange"],
+        ["Vendors with Gaps", "vendors_with_gaps", "orange"],
+    ]
+    for label, field in SCORE_FIELDS:
+        columns.append([f"{label} Mean", f"{field}_mean", "orange"])
+        columns.extend([[f"{label} P{p}", f"{field}_p{p}"] for p in PERCENTILES])
+
+    return columns
+
+
+def _chunks(total, size):
+    # Slices over total rows or columns that each hold about CHUNK_SCORES scores when one of them holds size scores
+    step = max(1, CHUNK_SCORES // max(1, size))
+    for start in range(0, total, step):
+        yield slice(start, start + step)
+
+
+def control_statistics(matrix):
+    vendors, controls, fields = matrix.scores.shape
+    means = np.empty((controls, fields))
+    percentiles = np.empty((len(PERCENTILES), controls, fields))
+    vendors_scored = np.empty(controls, dtype=np.intp)
+    for s in _chunks(controls, vendors * fields):
+        chunk = matrix.scores[:, s].astype(np.float64)
+        with warnings.catch_warnings():
+            # Controls nobody was scored on produce all NaN slices, their statistics are left empty
+            warnings.simplefilter("ignore", RuntimeWarning)
+            means[s] = np.nanmean(chunk, axis=0)
+            percentiles[:, s] = np.nanpercentile(chunk, PERCENTILES, axis=0)
+        vendors_scored[s] = (~np.isnan(chunk)).any(axis=2).sum(axis=0)
+
+    vendors_with_gaps = matrix.gaps.sum(axis=0)
+
+    rows = []
+    for c, (number, name, question_type) in enumerate(matrix.controls):
+        row = {
+            "number": number,
+            "name": name,
+            "question_type": question_type,
+            "vendors_scored": vendors_scored[c],
+            "vendors_with_gaps": vendors_with_gaps[c],
+        }
+        for f, (_, field) in enumerate(SCORE_FIELDS):
+            row[f"{field}_mean"] = means[c, f]
+            row.update({f"{field}_p{p}": percentiles[i, c, f] for i, p in enumerate(PERCENTILES)})
+
+        rows.append({k: _cell(v) for k, v in row.items()})
+
+    return rows
+
+
+def vendor_rankings_columns():
+    columns = [
+        ["Rank", "rank", "blue"],
+        ["Company Name", "name", "blue"],
+        ["Company ID", "id", "blue"],
+        ["Controls Scored", "controls_scored", "orange"],
+        ["Gaps", "gaps", "orange"],
+    ]
+    columns.extend([[f"Mean {label} Score", f"{field}_mean", "orange"] for label, field in SCORE_FIELDS])
+
+    return columns
+
+
+def vendor_rankings(matrix):
+    ranked = np.array([c[2] in RANKED_QUESTION_TYPES for c in matrix.controls], dtype=bool)
+    vendors, _, fields = matrix.scores.shape
+    means = np.empty((vendors, fields))
+    controls_scored = np.empty(vendors, dtype=np.intp)
+    for s in _chunks(vendors, int(ranked.sum()) * fields):
+        chunk = matrix.scores[s][:, ranked].astype(np.float64)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            means[s] = np.nanmean(chunk, axis=1)
+        controls_scored[s] = (~np.isnan(chunk)).any(axis=2).sum(axis=1)
+
+    gaps = matrix.gaps.sum(axis=1)
+
+    # Vendors are ranked by their mean effectiveness, vendors without any scores are ranked last
+    ranking = np.argsort(-np.nan_to_num(means[:, 0], nan=-np.inf), kind="stable")
+
+    rows = []
+    for rank, v in enumerate(ranking):
+        vendor_id, name = matrix.vendors[v]
+        row = {"rank": rank + 1, "name": name, "id": vendor_id, "controls_scored": controls_scored[v], "gaps": gaps[v]}
+        row.update({f"{field}_mean": means[v, f] for f, (_, field) in enumerate(SCORE_FIELDS)})
+        rows.append({k: _cell(value) for k, value in row.items()})
+
+    return rows
+
+
+def write_csv(filename, columns, rows):
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([c[0] for c in columns])
+        for row in rows:
+            writer.writerow(["" if row[c[1]] is None else row[c[1]] for c in columns])
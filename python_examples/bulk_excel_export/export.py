@@ -10,7 +10,29 @@
 
 import os
 import json
-import requests
+import click
+from analytics import (
+    CONTROL_STATISTICS_TABLE,
+    VENDOR_RANKINGS_TABLE,
+    control_statistics,
+    control_statistics_columns,
+    score_matrix_writer,
+    vendor_rankings,
+    vendor_rankings_columns,
+    write_csv,
+)
+from control_tree import control_tree
+from gap_index import (
+    GAP_INDEX_FILE,
+    GAP_PIVOT_COLUMNS,
+    GAP_PIVOT_TABLE,
+    gap_index_writer,
+    gap_pivot_rows,
+    save_gap_index,
+)
+from metrics import metrics_option, phase
+from profiling import profile_option
+from telemetry import session, telemetry_option
 from openpyxl import Workbook
 from tqdm import tqdm
 from utils import sheet_writer, inherent_risk_level_from_tier
@@ -76,6 +98,14 @@ SCORE_COLUMNS = [
     ["Effectiveness Score", "effectiveness_score", "orange"],
     ["Coverage Score", "coverage_score", "orange"],
     ["Maturity Score", "maturity_score", "orange"],
+    ["Question Type", "question_type"],
+    ["Parent Number", "parent_number"],
+    ["Rollup Subcontrols", "rollup_subcontrols"],
+    ["Rollup Findings", "rollup_findings"],
+    ["Rollup High Findings", "rollup_high_findings"],
+    ["Rollup Effectiveness", "rollup_effectiveness_score"],
+    ["Rollup Coverage", "rollup_coverage_score"],
+    ["Rollup Maturity", "rollup_maturity_score"],
 ]
 
 SCORE_MAPPING = {
@@ -83,6 +113,15 @@ SCORE_MAPPING = {
     "coverage_score": Coalesce("coverage_score", default=None),
     "maturity_score": Coalesce("maturity_score", default=None),
     "answer_state": Coalesce("answer_state", default=None),
+    "question_type": Coalesce("question_type", default=None),
+    "parent_number": Coalesce("parent_number", default=None),
+    # Subcontrol scores and findings rolled up to each control and domain, see control_tree.py
+    "rollup_subcontrols": Coalesce("rollup.subcontrols", default=None),
+    "rollup_findings": Coalesce("rollup.findings", default=None),
+    "rollup_high_findings": Coalesce("rollup.high_findings", default=None),
+    "rollup_effectiveness_score": Coalesce("rollup.effectiveness_score_mean", default=None),
+    "rollup_coverage_score": Coalesce("rollup.coverage_score_mean", default=None),
+    "rollup_maturity_score": Coalesce("rollup.maturity_score_mean", default=None),
 }
 
 TAG_COLUMNS = [
@@ -100,7 +139,17 @@ RESIDUAL_RISK_COLUMNS = [
 ]
 
 
-def retrieve_ecosystem():
+@click.command()
+@click.option(
+    "--score-analytics",
+    help="Add per control statistics and vendor rankings computed from the score matrix, as sheets or CSV files",
+    type=click.Choice(["sheets", "csv"]),
+    required=False,
+)
+@metrics_option
+@telemetry_option
+@profile_option
+def retrieve_ecosystem(score_analytics):
     api = os.environ.get("CYBERGRX_BULK_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
     if not token:
@@ -108,8 +157,11 @@ def retrieve_ecosystem():
 
     uri = api + "/bulk-v1/third-parties"
     print("Fetching third parties from " + uri + " this can take some time.")
-    response = requests.get(uri, headers={"Authorization": token.strip()})
-    result = json.loads(response.content.decode("utf-8"))
+    with phase("fetch"):
+        response = session.get(uri, headers={"Authorization": token.strip()})
+    with phase("parse") as count:
+        result = json.loads(response.content.decode("utf-8"))
+        count(len(result))
 
     print("Retrieved " + str(len(result)) + " third parties from your ecosystem, building an excel.")
 
@@ -119,37 +171,78 @@ def retrieve_ecosystem():
     wb.create_sheet(CONTROL_SCORES)
     wb.create_sheet(COMPANY_TAGS)
     wb.create_sheet(RESIDUAL_RISK_TABLE)
+    wb.create_sheet(GAP_PIVOT_TABLE)
 
     third_party_writer = sheet_writer(wb, THIRD_PARTY_TABLE, TP_COLUMNS, mapping=TP_MAPPING)
     findings_writer = sheet_writer(wb, GAPS_TABLE, GAPS_COLUMNS)
     scores_writer = sheet_writer(wb, CONTROL_SCORES, SCORE_COLUMNS, mapping=SCORE_MAPPING)
     tags_writer = sheet_writer(wb, COMPANY_TAGS, TAG_COLUMNS)
+    gap_pivot_writer = sheet_writer(wb, GAP_PIVOT_TABLE, GAP_PIVOT_COLUMNS)
+    gap_writer = gap_index_writer()
     residual_risk_writer = sheet_writer(wb, RESIDUAL_RISK_TABLE, RESIDUAL_RISK_COLUMNS)
-
-    for tp in tqdm(result, total=len(result), desc="Third Party"):
-        third_party_writer(tp)
-        for tag in glom(tp, Coalesce("tags", default=[])):
-            tags_writer({"tag": tag, "company_name": tp["name"]})
-
-        for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
-            finding["company_name"] = tp["name"]
-            findings_writer(finding)
-
-        for score in glom(tp, Coalesce("residual_risk.scores", default=[])):
-            score["company_name"] = tp["name"]
-            scores_writer(score)
-
-        for outcome in glom(tp, Coalesce("residual_risk.residual_risk_outcomes", default=[])):
-            outcome["company_name"] = tp["name"]
-            residual_risk_writer(outcome)
-
-    # Finalize each writer (fix width, ETC)
-    third_party_writer.finalizer()
-    findings_writer.finalizer()
-    scores_writer.finalizer()
-    tags_writer.finalizer()
-    residual_risk_writer.finalizer()
-    wb.save("ecosystem.xlsx")
+    matrix_writer = score_matrix_writer() if score_analytics else None
+
+    with phase("write") as count:
+        for tp in tqdm(result, total=len(result), desc="Third Party"):
+            count()
+            third_party_writer(tp)
+            for tag in glom(tp, Coalesce("tags", default=[])):
+                tags_writer({"tag": tag, "company_name": tp["name"]})
+
+            for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
+                finding["company_name"] = tp["name"]
+                findings_writer(finding)
+                gap_writer(tp["name"], tp["id"], finding)
+
+            scores = glom(tp, Coalesce("residual_risk.scores", default=[]))
+            rollups = control_tree(scores, glom(tp, Coalesce("residual_risk.findings", default=[])))
+            for score in scores:
+                score["company_name"] = tp["name"]
+                score["rollup"] = rollups.get(score.get("number"))
+                scores_writer(score)
+
+            for outcome in glom(tp, Coalesce("residual_risk.residual_risk_outcomes", default=[])):
+                outcome["company_name"] = tp["name"]
+                residual_risk_writer(outcome)
+
+            if matrix_writer:
+                matrix_writer(tp)
+
+    with phase("finalize"):
+        # Finalize each writer (fix width, ETC)
+        third_party_writer.finalizer()
+        findings_writer.finalizer()
+        scores_writer.finalizer()
+        tags_writer.finalizer()
+
+        # Pivot the gap index, one row per control with every vendor that has a gap on it
+        gap_index = gap_writer.finalizer()
+        for row in gap_pivot_rows(gap_index):
+            gap_pivot_writer(row)
+        gap_pivot_writer.finalizer()
+        save_gap_index(GAP_INDEX_FILE, gap_index)
+        residual_risk_writer.finalizer()
+
+        if matrix_writer:
+            matrix = matrix_writer.finalizer()
+            statistics = [
+                [CONTROL_STATISTICS_TABLE, control_statistics_columns(), control_statistics(matrix)],
+                [VENDOR_RANKINGS_TABLE, vendor_rankings_columns(), vendor_rankings(matrix)],
+            ]
+
+            for table, columns, rows in statistics:
+                if score_analytics == "csv":
+                    write_csv(f"{table.lower().replace(' ', '-')}.csv", columns, rows)
+                    continue
+
+                wb.create_sheet(table)
+                statistics_writer = sheet_writer(wb, table, columns)
+                for row in rows:
+                    statistics_writer(row)
+                statistics_writer.finalizer()
+
+    with phase("save"):
+        wb.save("ecosystem.xlsx")
 
 
 if __name__ == "__main__":
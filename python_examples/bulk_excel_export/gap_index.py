@@ -0,0 +1,126 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import json
+import os
+import re
+
+import click
+
+GAP_PIVOT_TABLE = "Control Gap Pivot"
+GAP_INDEX_FILE = "gap-index.json"
+IMPACT_LEVELS = ["High", "Medium", "Low"]
+
+# Excel refuses cells longer than 32767 characters
+MAX_CELL_LENGTH = 32000
+
+GAP_PIVOT_COLUMNS = [
+    ["Control Number", "number", "blue"],
+    ["Control Name", "name", "blue"],
+    ["Vendor Count", "vendor_count", "orange"],
+    ["High", "high", "orange"],
+    ["Medium", "medium", "orange"],
+    ["Low", "low", "orange"],
+    ["Vendors", "vendors"],
+]
+
+
+def _natural_key(number):
+    return [(0, int(p), "") if p.isdigit() else (1, 0, p) for p in re.split(r"[.\s]+", f"{number}")]
+
+
+def _impact_order(vendor):
+    level = vendor["impact_level"]
+    return IMPACT_LEVELS.index(level) if level in IMPACT_LEVELS else len(IMPACT_LEVELS), f"{vendor['name']}"
+
+
+def gap_index_writer():
+    # Inverted index of the findings, control number -> the vendors with a gap on that control and its impact level
+    controls = {}
+
+    def writer(company_name, company_id, finding):
+        number = finding.get("number")
+        control = controls.setdefault(number, {"name": finding.get("name"), "vendors": []})
+        control["vendors"].append(
+            {"name": company_name, "id": company_id, "impact_level": finding.get("impact_level")}
+        )
+
+    def finalizer():
+        index = {}
+        for number in sorted(controls, key=_natural_key):
+            control = controls[number]
+            control["vendors"].sort(key=_impact_order)
+            index[number] = control
+
+        return index
+
+    writer.finalizer = finalizer
+    return writer
+
+
+def gap_pivot_rows(index):
+    for number, control in index.items():
+        vendors = control["vendors"]
+        levels = [v["impact_level"] for v in vendors]
+        listing = ", ".join(f"{v['name']} ({v['impact_level']})" for v in vendors)
+        if len(listing) > MAX_CELL_LENGTH:
+            listing = listing[:MAX_CELL_LENGTH] + "..."
+
+        yield {
+            "number": number,
+            "name": control["name"],
+            "vendor_count": len(set((v["id"], v["name"]) for v in vendors)),
+            "high": levels.count("High"),
+            "medium": levels.count("Medium"),
+            "low": levels.count("Low"),
+            "vendors": listing,
+        }
+
+
+def save_gap_index(filename, index):
+    with open(filename, "w") as f:
+        f.write(json.dumps({"controls": index}, indent=2))
+
+
+def load_gap_index(filename):
+    if not os.path.exists(filename):
+        raise Exception(f"{filename} does not exist, run the export first to build it.")
+
+    with open(filename) as f:
+        return json.load(f)["controls"]
+
+
+@click.command()
+@click.argument("control")
+@click.option(
+    "--impact", help="Only list gaps with this impact level", type=click.Choice(IMPACT_LEVELS), required=False,
+)
+@click.option("--index", "index_filename", help="Gap index written by the export", default=GAP_INDEX_FILE)
+def query(control, impact, index_filename):
+    index = load_gap_index(index_filename)
+
+    # An exact control number, or a parent such as 3.2 to list every control below it
+    numbers = [n for n in index if n == control or n.startswith(f"{control}.")]
+    if not numbers:
+        print(f"No vendors have a gap on {control}")
+        return
+
+    for number in numbers:
+        vendors = [v for v in index[number]["vendors"] if not impact or v["impact_level"] == impact]
+        if not vendors:
+            continue
+
+        print(f"{number} {index[number]['name']} ({len(vendors)} vendors)")
+        for v in vendors:
+            print(f"    {v['impact_level']}\t{v['name']}\t{v['id'] or ''}")
+
+
+if __name__ == "__main__":
+    query()
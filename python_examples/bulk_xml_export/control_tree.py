@@ -0,0 +1,71 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+ROLLUP_FIELDS = ["effectiveness_score", "coverage_score", "maturity_score"]
+IMPACT_LEVELS = ["High", "Medium", "Low"]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def control_tree(scores, findings=None):
+    # Index a vendor's scores by control number, every subcontrol score and every finding is added to the control
+    # it belongs to and each of its parents, the tree is only a few levels deep so this is linear in the input
+    nodes = {}
+    for score in scores:
+        nodes[score.get("number")] = {
+            "number": score.get("number"),
+            "name": score.get("name"),
+            "question_type": score.get("question_type"),
+            "parent_number": score.get("parent_number"),
+            "subcontrols": 0,
+            "findings": 0,
+            **{f"{level.lower()}_findings": 0 for level in IMPACT_LEVELS},
+            **{f"{field}_sum": 0 for field in ROLLUP_FIELDS},
+            **{f"{field}_count": 0 for field in ROLLUP_FIELDS},
+        }
+
+    def lineage(number):
+        seen = set()
+        while number in nodes and number not in seen:
+            seen.add(number)
+            yield nodes[number]
+            number = nodes[number]["parent_number"]
+
+    # Leaves are the scores nothing else points to as a parent, usually the subcontrols
+    parents = set(node["parent_number"] for node in nodes.values())
+    for score in scores:
+        if score.get("number") in parents:
+            continue
+
+        for node in lineage(score.get("number")):
+            node["subcontrols"] += 1
+            for field in ROLLUP_FIELDS:
+                if _is_number(score.get(field)):
+                    node[f"{field}_sum"] += score[field]
+                    node[f"{field}_count"] += 1
+
+    for finding in findings or []:
+        level = f"{finding.get('impact_level')}".lower()
+        for node in lineage(finding.get("number")):
+            node["findings"] += 1
+            if f"{level}_findings" in node:
+                node[f"{level}_findings"] += 1
+
+    rollups = {}
+    for number, node in nodes.items():
+        rollup = {k: v for k, v in node.items() if not k.endswith("_sum") and not k.endswith("_count")}
+        for field in ROLLUP_FIELDS:
+            count = node[f"{field}_count"]
+            rollup[f"{field}_mean"] = node[f"{field}_sum"] / count if count else None
+        rollups[number] = rollup
+
+    return rollups
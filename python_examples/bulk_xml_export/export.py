@@ -10,11 +10,16 @@
 
 import os
 import json
-import requests
-import dicttoxml
+from multiprocessing import Pool
+
+import click
 from tqdm import tqdm
 from glom import glom, Coalesce, OMIT
-from xml.dom.minidom import parseString
+from control_tree import control_tree
+from metrics import metrics_option, phase
+from profiling import profile_option
+from telemetry import session, telemetry_option
+from utils import dicttoxml_writer, compact_xml_writer, sharded_xml_writer
 
 # yapf: disable
 TP_MAPPING = {
@@ -57,12 +62,73 @@ TP_MAPPING = {
 }
 # yapf: enable
 
+# Subcontrol scores and findings rolled up to each control and domain, see control_tree.py
+ROLLUP_MAPPING = {
+    "rollup_subcontrols": "subcontrols",
+    "rollup_findings": "findings",
+    "rollup_high_findings": "high_findings",
+    "rollup_effectiveness_score": "effectiveness_score_mean",
+    "rollup_coverage_score": "coverage_score_mean",
+    "rollup_maturity_score": "maturity_score_mean",
+}
+
+
+def transform_third_party(tp):
+    processed = glom(tp, TP_MAPPING)
+    rollups = control_tree(processed["scores"], processed["findings"])
+    for score in processed["scores"]:
+        rollup = rollups.get(score["number"], {})
+        score.update({k: rollup.get(v) for k, v in ROLLUP_MAPPING.items()})
+
+    return processed
+
 
-def item_type(value):
-    return value[:-1]
+def transformed_third_parties(third_parties, workers):
+    if workers <= 1:
+        for tp in third_parties:
+            yield transform_third_party(tp)
+        return
 
+    # Ship vendors to the pool in chunks, imap preserves the order of the ecosystem
+    chunksize = max(1, min(100, len(third_parties) // (workers * 4)))
+    with Pool(workers) as pool:
+        for processed in pool.imap(transform_third_party, third_parties, chunksize=chunksize):
+            yield processed
+
+
+@click.command()
+@click.option(
+    "--compact", help="Write XML without dicttoxml type attributes, see ecosystem.xsd for the schema", is_flag=True,
+)
+@click.option(
+    "--attributes", help="With --compact, write scalar fields as XML attributes instead of elements", is_flag=True,
+)
+@click.option(
+    "--repeat-lists",
+    help="With --compact, write scores and findings as repeated elements without a wrapping list element",
+    is_flag=True,
+)
+@click.option(
+    "--shard-dir",
+    help="Write one XML file per vendor (or per --vendors-per-file) into this directory",
+    required=False,
+)
+@click.option(
+    "--vendors-per-file", help="With --shard-dir, how many vendors to write into each file", default=1, type=int,
+)
+@click.option(
+    "--workers", help="Transform third parties in a pool of this many processes", default=1, type=int,
+)
+@metrics_option
+@telemetry_option
+@profile_option
+def retrieve_ecosystem(compact, attributes, repeat_lists, shard_dir, vendors_per_file, workers):
+    if (attributes or repeat_lists) and not compact:
+        raise Exception("--attributes and --repeat-lists are only supported with --compact")
+
+    if vendors_per_file < 1:
+        raise Exception("--vendors-per-file must be at least 1")
 
-def retrieve_ecosystem():
     api = os.environ.get("CYBERGRX_BULK_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
     if not token:
@@ -70,23 +136,39 @@ def retrieve_ecosystem():
 
     uri = api + "/bulk-v1/third-parties"
     print("Fetching third parties from " + uri + " this can take some time.")
-    response = requests.get(uri, headers={"Authorization": token.strip()})
-    result = json.loads(response.content.decode("utf-8"))
+    with phase("fetch"):
+        response = session.get(uri, headers={"Authorization": token.strip()})
+    with phase("parse") as count:
+        result = json.loads(response.content.decode("utf-8"))
+        count(len(result))
 
     print("Retrieved " + str(len(result)) + " third parties from your ecosystem, building an xml manifest.")
 
-    with open("ecosystem.json", "w") as f:
+    with phase("save"), open("ecosystem.json", "w") as f:
         f.write(json.dumps(result, indent=2))
 
-    third_parties = []
-    for tp in tqdm(result, total=len(result), desc="Third Party"):
-        processed = glom(tp, TP_MAPPING)
-        if processed["scores"]:
-            third_parties.append(processed)
+    def make_writer(stream):
+        if compact:
+            return compact_xml_writer(stream, attributes=attributes, repeat_lists=repeat_lists)
+
+        return dicttoxml_writer(stream)
+
+    def write_xml(xml_writer):
+        # Vendors are transformed lazily as they are written, the write phase includes the transform
+        with phase("write") as count:
+            for processed in tqdm(transformed_third_parties(result, workers), total=len(result), desc="Third Party"):
+                count()
+                if processed["scores"]:
+                    xml_writer(processed)
+
+            xml_writer.finalizer()
 
-    third_party_xml = dicttoxml.dicttoxml(third_parties, custom_root="vendors", item_func=item_type)
-    with open("ecosystem.xml", "w") as f:
-        f.write(parseString(third_party_xml).toprettyxml())
+    if shard_dir:
+        write_xml(sharded_xml_writer(shard_dir, vendors_per_file, make_writer))
+        print(f"Wrote sharded XML and manifest.json to {shard_dir}")
+    else:
+        with open("ecosystem.xml", "wb") as f:
+            write_xml(make_writer(f))
 
 
 if __name__ == "__main__":
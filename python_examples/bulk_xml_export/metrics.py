@@ -0,0 +1,115 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import functools
+import json
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+import click
+
+# Phases are recorded in the order they first run, a phase that runs more than once accumulates its time and items.
+# A phase started inside another one is recorded under its parent, its time is also part of the parent's time
+_phases = OrderedDict()
+_stack = []
+
+# Context managers entered around each outermost phase with its name, --profile uses them to profile every phase
+_hooks = []
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def reset():
+    _phases.clear()
+    del _stack[:]
+
+
+@contextmanager
+def phase(name, items=0):
+    # Yields a counter, call it with the number of items processed when they are not known up front
+    key = "/".join(_stack + [name])
+    entry = _phases.setdefault(
+        key, {"parent": "/".join(_stack) or None, "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "items": 0}
+    )
+    entry["items"] += items
+
+    def count(n=1):
+        entry["items"] += n
+
+    with ExitStack() as hooks:
+        for hook in [] if _stack else list(_hooks):
+            hooks.enter_context(hook(name))
+
+        # CPU time is for this process only, work done in worker pools shows up as wall time
+        wall, cpu = time.perf_counter(), time.process_time()
+        _stack.append(name)
+        try:
+            yield count
+        finally:
+            _stack.pop()
+            entry["calls"] += 1
+            entry["wall_seconds"] += time.perf_counter() - wall
+            entry["cpu_seconds"] += time.process_time() - cpu
+
+
+def summary():
+    phases = OrderedDict()
+    for key, entry in _phases.items():
+        rate = entry["items"] / entry["wall_seconds"] if entry["items"] and entry["wall_seconds"] else None
+        phases[key] = {**entry, "items_per_second": rate}
+
+    return phases
+
+
+def print_summary():
+    phases = summary()
+    if not phases:
+        return
+
+    # Nested phases are indented below their parent
+    labels = {key: "  " * key.count("/") + key.rsplit("/", 1)[-1] for key in phases}
+    width = max(len("Phase"), *[len(label) for label in labels.values()])
+    print("")
+    print(f"{'Phase':<{width}}  {'Calls':>6}  {'Wall (s)':>10}  {'CPU (s)':>10}  {'Items':>9}  {'Items/s':>10}")
+    for key, entry in phases.items():
+        rate = f"{entry['items_per_second']:.1f}" if entry["items_per_second"] else "-"
+        wall, cpu = entry["wall_seconds"], entry["cpu_seconds"]
+        print(
+            f"{labels[key]:<{width}}  {entry['calls']:>6}  {wall:>10.3f}  {cpu:>10.3f}  "
+            f"{entry['items']:>9}  {rate:>10}"
+        )
+
+
+def save_metrics(filename):
+    with open(filename, "w") as f:
+        f.write(json.dumps({"phases": summary()}, indent=2))
+
+
+def metrics_option(command):
+    # Adds --metrics-out to a click command, the phase summary is printed when the command exits
+    @click.option("--metrics-out", help="Write per phase timings and throughput to this JSON file", required=False)
+    @functools.wraps(command)
+    def wrapper(*args, metrics_out=None, **kwargs):
+        reset()
+        try:
+            return command(*args, **kwargs)
+        finally:
+            print_summary()
+            if metrics_out:
+                save_metrics(metrics_out)
+
+    return wrapper
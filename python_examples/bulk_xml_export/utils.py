@@ -0,0 +1,199 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import hashlib
+import json
+import os
+import re
+from io import BytesIO
+from xml.dom.minidom import parseString
+from xml.sax.saxutils import XMLGenerator
+
+import dicttoxml
+
+# List fields and the element name used for each of their items
+LIST_ITEMS = {
+    "residual_risk_outcomes": "residual_risk_outcome",
+    "scores": "score",
+    "findings": "finding",
+}
+
+_XML_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_.-]*$")
+
+
+def item_type(value):
+    return value[:-1]
+
+
+def _xml_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+
+    return f"{value}"
+
+
+def _is_scalar(value):
+    return not isinstance(value, (dict, list, tuple))
+
+
+def dicttoxml_writer(stream):
+    third_parties = []
+
+    def writer(third_party):
+        third_parties.append(third_party)
+
+    def finalizer():
+        third_party_xml = dicttoxml.dicttoxml(third_parties, custom_root="vendors", item_func=item_type)
+        stream.write(parseString(third_party_xml).toprettyxml().encode("utf-8"))
+
+    writer.finalizer = finalizer
+    return writer
+
+
+def compact_xml_writer(stream, attributes=False, repeat_lists=False):
+    xml = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+
+    def start(name, attrs=None):
+        xml.startElement(name, attrs if attrs else {})
+
+    def element(name, value):
+        # Keys that are not valid XML names (custom_metadata is free form) are preserved in a name attribute
+        if not _XML_NAME.match(name):
+            start("entry", {"name": name})
+            name = "entry"
+        else:
+            start(name)
+
+        if isinstance(value, dict):
+            for k, v in value.items():
+                if v is not None:
+                    element(f"{k}", v)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                if v is not None:
+                    element("item", v)
+        else:
+            xml.characters(_xml_value(value))
+
+        xml.endElement(name)
+
+    def record(name, blob):
+        attrs = {}
+        if attributes:
+            attrs = {
+                k: _xml_value(v) for k, v in blob.items() if v is not None and _is_scalar(v) and _XML_NAME.match(k)
+            }
+
+        start(name, attrs)
+        for k, v in blob.items():
+            if v is None or k in attrs:
+                continue
+
+            if k in LIST_ITEMS:
+                if not repeat_lists:
+                    start(k)
+
+                for item in v:
+                    if isinstance(item, dict):
+                        record(LIST_ITEMS[k], item)
+                    else:
+                        element(LIST_ITEMS[k], item)
+
+                if not repeat_lists:
+                    xml.endElement(k)
+            else:
+                element(k, v)
+
+        xml.endElement(name)
+
+    xml.startDocument()
+    start("vendors")
+
+    def writer(third_party):
+        xml.ignorableWhitespace("\n")
+        record("vendor", third_party)
+
+    def finalizer():
+        xml.ignorableWhitespace("\n")
+        xml.endElement("vendors")
+        xml.ignorableWhitespace("\n")
+        xml.endDocument()
+
+    writer.finalizer = finalizer
+    return writer
+
+
+def _shard_filename(vendors, vendors_per_file, index):
+    if vendors_per_file == 1:
+        return re.sub(r"[^A-Za-z0-9_.-]+", "-", f"vendor-{vendors[0]['id']}") + ".xml"
+
+    return f"vendors-{index:05d}.xml"
+
+
+def sharded_xml_writer(directory, vendors_per_file, make_writer):
+    manifest_filename = os.path.join(directory, "manifest.json")
+    os.makedirs(directory, exist_ok=True)
+
+    # Checksums from the last run, files that did not change are not rewritten so their timestamps are preserved
+    previous = {}
+    if os.path.exists(manifest_filename):
+        with open(manifest_filename) as f:
+            previous = {s["file"]: s["checksum"] for s in json.load(f).get("files", [])}
+
+    shards = []
+    pending = []
+
+    def flush():
+        buffer = BytesIO()
+        xml_writer = make_writer(buffer)
+        for third_party in pending:
+            xml_writer(third_party)
+        xml_writer.finalizer()
+
+        content = buffer.getvalue()
+        checksum = "sha256:" + hashlib.sha256(content).hexdigest()
+        filename = _shard_filename(pending, vendors_per_file, len(shards) + 1)
+        path = os.path.join(directory, filename)
+        if previous.get(filename) != checksum or not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(content)
+
+        shards.append(
+            {
+                "file": filename,
+                "checksum": checksum,
+                "vendors": [
+                    {"id": tp["id"], "report_id": tp["report_id"], "report_date": tp["report_release_date"]}
+                    for tp in pending
+                ],
+            }
+        )
+        pending.clear()
+
+    def writer(third_party):
+        pending.append(third_party)
+        if len(pending) >= vendors_per_file:
+            flush()
+
+    def finalizer():
+        if pending:
+            flush()
+
+        # Remove shards from a previous run that are no longer part of the export
+        current = set(s["file"] for s in shards)
+        for filename in previous:
+            if filename not in current and os.path.exists(os.path.join(directory, filename)):
+                os.remove(os.path.join(directory, filename))
+
+        with open(manifest_filename, "w") as f:
+            f.write(json.dumps({"vendors_per_file": vendors_per_file, "files": shards}, indent=2))
+
+    writer.finalizer = finalizer
+    return writer
@@ -10,7 +10,7 @@
 
 import datetime
 
-from glom import Check, Coalesce, SKIP
+from glom import Coalesce
 from pytz import UTC
 
 YESTERDAY = (datetime.datetime.utcnow().replace(tzinfo=UTC) - datetime.timedelta(days=1)).isoformat()
@@ -22,6 +22,9 @@ GAPS_TABLE = "Control Gaps (Findings)"
 THIRD_PARTY_TABLE = "Vendor Metadata"
 RESIDUAL_RISK_TABLE = "Residual Risk"
 
+# Compiled Jinja templates are kept here between runs
+TEMPLATE_CACHE_DIR = ".template-cache"
+
 VALIDATION_LABELS = {
     "FullyValidated": "Fully Validated",
     "PartiallyValidated": "Partially Validated",
@@ -83,26 +86,34 @@ GAPS_COLUMNS = [
     ["Remedy", "remedy", "orange"],
 ]
 
-GAPS_SUMMARY = {
-    "total_findings": (Coalesce("residual_risk.findings", default=[]), len),
-    "total_high_findings": (
-        Coalesce("residual_risk.findings", default=[]),
-        ["impact_level"],
-        [Check(equal_to="High", default=SKIP)],
-        len,
-    ),
-    "total_medium_findings": (
-        Coalesce("residual_risk.findings", default=[]),
-        ["impact_level"],
-        [Check(equal_to="Medium", default=SKIP)],
-        len,
-    ),
-    "total_low_findings": (
-        Coalesce("residual_risk.findings", default=[]),
-        ["impact_level"],
-        [Check(equal_to="Low", default=SKIP)],
-        len,
-    ),
+SUMMARY_COLLECTIONS = {
+    "findings": "residual_risk.findings",
+    "scores": "residual_risk.scores",
+}
+
+# Per vendor statistics added to the report metadata, each entry is [collection, aggregation, field, match]
+# aggregation is one of count, distribution, mean, min or max, field is a key or a function of the item
+SUMMARY_STATISTICS = {
+    "total_findings": ["findings", "count"],
+    "total_high_findings": ["findings", "count", "impact_level", "High"],
+    "total_medium_findings": ["findings", "count", "impact_level", "Medium"],
+    "total_low_findings": ["findings", "count", "impact_level", "Low"],
+    "findings_by_impact_level": ["findings", "distribution", "impact_level"],
+    "total_scores": ["scores", "count"],
+    "total_not_reviewed_scores": [
+        "scores",
+        "count",
+        lambda v: validation_label(v.get("validation_state")),
+        "Not Reviewed",
+    ],
+    "scores_by_validation": ["scores", "distribution", lambda v: validation_label(v.get("validation_state"))],
+    "scores_by_answer_state": ["scores", "distribution", "answer_state"],
+    "mean_effectiveness_score": ["scores", "mean", "effectiveness_score"],
+    "min_effectiveness_score": ["scores", "min", "effectiveness_score"],
+    "mean_coverage_score": ["scores", "mean", "coverage_score"],
+    "min_coverage_score": ["scores", "min", "coverage_score"],
+    "mean_maturity_score": ["scores", "mean", "maturity_score"],
+    "min_maturity_score": ["scores", "min", "maturity_score"],
 }
 
 SCORE_COLUMNS = [
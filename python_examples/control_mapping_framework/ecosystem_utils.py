@@ -7,6 +7,9 @@
 #            \/\/          \/     \/               \/        \/      \_/
 #
 #
+import os
+from copy import copy
+
 from attrdict import AttrDict
 from config import (
     CONTROL_SCORES,
@@ -23,77 +26,168 @@ from config import (
     RESIDUAL_RISK_TABLE,
     RESIDUAL_RISK_COLUMNS,
 )
+from gap_index import (
+    GAP_INDEX_FILE,
+    GAP_PIVOT_COLUMNS,
+    GAP_PIVOT_TABLE,
+    gap_index_writer,
+    gap_pivot_rows,
+    save_gap_index,
+)
 from glom import glom, Coalesce
-from openpyxl import load_workbook
+from openpyxl import load_workbook, Workbook
+from openpyxl.cell import WriteOnlyCell
 from stringcase import snakecase
-from utils import sheet_writer, create_sheet, cell_value
+from utils import copy_sheet_properties, streaming_sheet_writer
+
+SUPPORT_SHEETS = [CONTROL_SCORES, GAPS_TABLE, COMPANY_TAGS, THIRD_PARTY_TABLE, RESIDUAL_RISK_TABLE]
+
+
+def header_key(value):
+    return snakecase(f"{value}".strip().lower() if value else "")
+
+
+def mapped_controls(excel_file):
+    # Accepts a filename or a workbook that is already in memory, returns the Mapped Controls headers and value rows
+    source_wb = load_workbook(excel_file, read_only=True) if isinstance(excel_file, str) else excel_file
+    rows = source_wb[MAPPED_CONTROLS_TABLE].iter_rows(values_only=True)
+    headers = next(rows, ())
+    values = [list(r) for r in rows]
+
+    if isinstance(excel_file, str):
+        source_wb.close()
+
+    return list(headers), values
 
 
-def read_ecosystem_template(wb):
+def copy_template_sheet(wb, template_sheet, max_row=None):
+    # Write only sheets are written top to bottom, the template's sheet settings and cell styles are carried over as-is
+    sheet = wb.create_sheet(template_sheet.title)
+    copy_sheet_properties(template_sheet, sheet, max_row=max_row)
+
+    for row in template_sheet.iter_rows(max_row=max_row):
+        cells = []
+        for c in row:
+            cell = WriteOnlyCell(sheet, value=c.value)
+            if c.has_style:
+                cell.font = copy(c.font)
+                cell.border = copy(c.border)
+                cell.fill = copy(c.fill)
+                cell.number_format = c.number_format
+                cell.protection = copy(c.protection)
+                cell.alignment = copy(c.alignment)
+            cells.append(cell)
+        sheet.append(cells)
+
+    return sheet
+
+
+def mapped_controls_template(template_wb):
     try:
-        sheet = wb[MAPPED_CONTROLS_TABLE]
+        return template_wb[MAPPED_CONTROLS_TABLE]
     except KeyError:
-        sheet = next((s for _, s in enumerate(wb)))
-        sheet.title = MAPPED_CONTROLS_TABLE
+        template_sheet = next((s for _, s in enumerate(template_wb)))
+        template_sheet.title = MAPPED_CONTROLS_TABLE
+        return template_sheet
+
 
+def read_ecosystem_template(template_sheet, wb):
     mapping = {}
-    for idx, header in enumerate(next(sheet.iter_rows())):
-        mapping[snakecase(cell_value(header).lower())] = idx + 1
+    for idx, header in enumerate(next(template_sheet.iter_rows(values_only=True))):
+        mapping[header_key(header)] = idx
 
     if "company_name" not in mapping:
         raise Exception(f"There is no Company Name column in {MAPPED_CONTROLS_TABLE}")
 
-    row_idx = 2
+    # Only the header row of Mapped Controls is kept, every vendor's rows are appended below it
+    sheet = copy_template_sheet(wb, template_sheet, max_row=1)
+    width = max(mapping.values()) + 1
 
-    def process_excel(excel_filename, company_name):
-        nonlocal row_idx
-        source_wb = load_workbook(excel_filename)
-        source_sheet = source_wb[MAPPED_CONTROLS_TABLE]
+    # Vendor workbooks all come from the same template, the column mapping is worked out once per header layout
+    column_mappings = {}
 
-        rowiterator = iter(source_sheet.rows)
-        source_mapping = {}
-        for _idx, _header in enumerate(next(rowiterator)):
-            source_mapping[_idx] = snakecase(cell_value(_header).lower())
+    def source_columns(headers):
+        key = tuple(headers)
+        if key not in column_mappings:
+            missing = [h for h in headers if header_key(h) not in mapping]
+            if missing:
+                raise Exception(f"The columns {missing} are not in the ecosystem {MAPPED_CONTROLS_TABLE} sheet")
 
-        for row in rowiterator:
-            sheet.cell(row=row_idx, column=mapping["company_name"]).value = company_name
-            for i, col in enumerate(row):
-                sheet.cell(row=row_idx, column=mapping[source_mapping[i]]).value = col.value
-            row_idx += 1
+            column_mappings[key] = [mapping[header_key(h)] for h in headers]
 
-    return process_excel
+        return column_mappings[key]
 
+    def mapped_controls_writer(company_name, headers, rows):
+        columns = source_columns(headers)
+        for values in rows:
+            row = [None] * width
+            row[mapping["company_name"]] = company_name
+            for idx, value in zip(columns, values):
+                row[idx] = value
+            sheet.append(row)
 
-def init_ecosystem_writer(ecosystem_template):
+    return mapped_controls_writer
+
+
+def init_ecosystem_writer(ecosystem_template, output_filename="ecosystem.xlsx"):
     if not ecosystem_template:
         return AttrDict(
             {
                 "tags_writer": lambda tag_meta: False,
-                "findings_writer": lambda finding: False,
+                "findings_writer": lambda finding, company_id=None: False,
                 "scores_writer": lambda score: False,
                 "third_party_writer": lambda tp: False,
-                "process_excel": lambda excel_filename, company_name: False,
+                "mapped_controls_writer": lambda company_name, headers, rows: False,
                 "finalizer": lambda: False,
+                "active": False,
             }
         )
 
-    wb = load_workbook(ecosystem_template)
-    process_excel = read_ecosystem_template(wb)
-    create_sheet(wb, CONTROL_SCORES)
-    create_sheet(wb, GAPS_TABLE)
-    create_sheet(wb, COMPANY_TAGS)
-    create_sheet(wb, THIRD_PARTY_TABLE)
-    create_sheet(wb, RESIDUAL_RISK_TABLE)
+    # The ecosystem report is streamed into a write only workbook, memory stays flat no matter how many vendors
+    template_wb = load_workbook(ecosystem_template)
+    wb = Workbook(write_only=True)
+    for defined_name in template_wb.defined_names.definedName:
+        wb.defined_names.append(defined_name)
 
     score_mapping = {"company_name": "company_name"}
     score_mapping.update(SCORE_MAPPING)
     score_columns = [["Company Name", "company_name"]]
     score_columns.extend(SCORE_COLUMNS)
-    scores_writer = sheet_writer(wb, CONTROL_SCORES, score_columns, mapping=score_mapping)
-    findings_writer = sheet_writer(wb, GAPS_TABLE, GAPS_COLUMNS)
-    tags_writer = sheet_writer(wb, COMPANY_TAGS, TAG_COLUMNS)
-    third_party_writer = sheet_writer(wb, THIRD_PARTY_TABLE, TP_COLUMNS, mapping=TP_MAPPING)
-    residual_risk_writer = sheet_writer(wb, RESIDUAL_RISK_TABLE, RESIDUAL_RISK_COLUMNS)
+    support_sheets = {
+        CONTROL_SCORES: dict(columns=score_columns, mapping=score_mapping),
+        GAPS_TABLE: dict(columns=GAPS_COLUMNS),
+        COMPANY_TAGS: dict(columns=TAG_COLUMNS),
+        THIRD_PARTY_TABLE: dict(columns=TP_COLUMNS, mapping=TP_MAPPING),
+        RESIDUAL_RISK_TABLE: dict(columns=RESIDUAL_RISK_COLUMNS),
+    }
+
+    # Sheets are created in the template's order, the support sheets it does not have are added after the others
+    writers = {}
+    mapped_controls_sheet = mapped_controls_template(template_wb)
+    for template_sheet in template_wb:
+        if template_sheet is mapped_controls_sheet:
+            mapped_controls_writer = read_ecosystem_template(template_sheet, wb)
+        elif template_sheet.title in support_sheets:
+            writers[template_sheet.title] = streaming_sheet_writer(
+                wb, template_sheet.title, template_sheet=template_sheet, **support_sheets[template_sheet.title]
+            )
+        else:
+            copy_template_sheet(wb, template_sheet)
+
+    for name in SUPPORT_SHEETS:
+        if name not in writers:
+            writers[name] = streaming_sheet_writer(wb, name, **support_sheets[name])
+
+    scores_writer = writers[CONTROL_SCORES]
+    findings_writer = writers[GAPS_TABLE]
+    tags_writer = writers[COMPANY_TAGS]
+    third_party_writer = writers[THIRD_PARTY_TABLE]
+    residual_risk_writer = writers[RESIDUAL_RISK_TABLE]
+    gap_writer = gap_index_writer()
+
+    def process_finding(finding, company_id=None):
+        findings_writer(finding)
+        gap_writer(finding["company_name"], company_id, finding)
 
     def process_third_party(tp):
         third_party_writer(tp)
@@ -108,15 +202,25 @@ def init_ecosystem_writer(ecosystem_template):
         tags_writer.finalizer()
         third_party_writer.finalizer()
         residual_risk_writer.finalizer()
-        wb.save(filename="ecosystem.xlsx")
+
+        # Pivot the gap index, one row per control with every vendor that has a gap on it
+        gap_index = gap_writer.finalizer()
+        gap_pivot_writer = streaming_sheet_writer(wb, GAP_PIVOT_TABLE, GAP_PIVOT_COLUMNS)
+        for row in gap_pivot_rows(gap_index):
+            gap_pivot_writer(row)
+        gap_pivot_writer.finalizer()
+        save_gap_index(os.path.join(os.path.dirname(output_filename), GAP_INDEX_FILE), gap_index)
+
+        wb.save(filename=output_filename)
 
     return AttrDict(
         {
             "tags_writer": lambda tag_meta: tags_writer(tag_meta),
-            "findings_writer": lambda finding: findings_writer(finding),
+            "findings_writer": process_finding,
             "scores_writer": lambda score: scores_writer(score),
             "third_party_writer": process_third_party,
-            "process_excel": process_excel,
+            "mapped_controls_writer": mapped_controls_writer,
             "finalizer": finalizer,
+            "active": True,
         }
     )
@@ -11,78 +11,140 @@
 import re
 from copy import copy
 
-from jinja2 import Template
-from openpyxl import load_workbook
+from attrdict import AttrDict
+from jinja2 import TemplateSyntaxError
 from openpyxl.cell import Cell, MergedCell
 from reporting import debug_keys, read_report
+from template_cache import cached_environment
 from utils import cell_value, create_sheet
 
+MULTIPLE_BLANK_LINES = re.compile(r"\n\n+")
+SET_STATEMENT = re.compile(r"{%-?\s*set\s")
+STYLE_ATTRIBUTES = ["font", "border", "fill", "number_format", "protection", "alignment"]
 
-def process_excel_template(filename, metadata=None, debug=False):
-    if not metadata:
-        metadata = {}
+# Rows rendered as one unit are written inline between these markers, the rendered output is split back into cells
+ROW_START = "\x1e"
+CELL_SEPARATOR = "\x1f"
+ROW_END = "\x1d"
+RENDERED_ROW = re.compile(f"{ROW_START}(\\d+)(?:{CELL_SEPARATOR}(.*?))?{ROW_END}", re.DOTALL)
 
-    report_data = read_report(filename)
-    metadata.update(report_data)
 
-    wb = load_workbook(filename=filename, data_only=True)
-    for _, sheet in enumerate(wb):
+def _cell_style(cell):
+    return {k: copy(getattr(cell, k)) for k in STYLE_ATTRIBUTES}
+
+
+def _compiles(environment, value):
+    try:
+        environment.parse(value)
+        return True
+    except TemplateSyntaxError:
+        return False
+
+
+def _row_template(index, values, whole_row):
+    if whole_row:
+        return f"{ROW_START}{index}{CELL_SEPARATOR}{CELL_SEPARATOR.join(values)}{ROW_END}"
+
+    # Each cell renders into its own set block, the whole row is then handed to emit as a list of values
+    cells = "".join(f"{{% set _c{j} %}}{v}{{% endset %}}" for j, v in enumerate(values))
+    arguments = ", ".join(f"_c{j}" for j in range(len(values)))
+    return f"{cells}{{{{ emit({index}, [{arguments}]) }}}}"
+
 
+def build_render_plan(wb):
+    # Analyze the template once, find every {%tr ... %} loop region and keep the styles of the rows it repeats
+    regions = []
+    environment = cached_environment("excel-template")
+
+    for _, sheet in enumerate(wb):
         start = None
-        end = None
+        depth = 0
         template = []
-        style = []
+        row_styles = []
 
         for i, row in enumerate(sheet):
             row_values = [cell_value(c) for _, c in enumerate(row) if isinstance(c, (Cell, MergedCell))]
             raw_values = " ".join(row_values)
             if "{%tr " in raw_values:
-                logic_statement = "".join(row_values).replace("{%tr", "{%").replace(" %}", " -%}")
+                template.append("".join(row_values).replace("{%tr", "{%"))
                 if "{%tr for" in raw_values:
-                    start = i
+                    start = i if depth == 0 else start
+                    depth += 1
                 elif "{%tr endfor" in raw_values:
-                    end = i
-
-                template.append(logic_statement)
-            elif start is not None and end is None:
-                style = [
-                    {
-                        "font": copy(c.font),
-                        "border": copy(c.border),
-                        "fill": copy(c.fill),
-                        "number_format": copy(c.number_format),
-                        "protection": copy(c.protection),
-                        "alignment": copy(c.alignment),
-                    }
-                    for c in row
-                ]
-                template.append("-=+".join(row_values))
-
-        if not template or start is None or end is None:
-            continue
-
-        raw_template = "\n".join(template)
+                    depth -= 1
+
+                if depth == 0 and start is not None:
+                    regions.append(
+                        AttrDict(
+                            sheet=sheet.title,
+                            start=start + 1,
+                            end=i + 1,
+                            template=environment.from_string("".join(template)),
+                            source="\n".join(template),
+                            styles=row_styles,
+                        )
+                    )
+                    start = None
+                    template = []
+                    row_styles = []
+            elif start is not None:
+                # A Jinja block that spans cells only compiles as part of the whole row, and a set statement in one
+                # cell has to stay visible to the cells after it, those rows are rendered as one unit
+                whole_row = any(SET_STATEMENT.search(v) or not _compiles(environment, v) for v in row_values)
+                template.append(_row_template(len(row_styles), row_values, whole_row))
+                row_styles.append([_cell_style(c) for c in row])
+
+    return AttrDict(regions=regions)
+
+
+def render_region(sheet, region, metadata):
+    emitted = []
+    styles = region.styles
+
+    def emit(index, values):
+        emitted.append(values)
+        return f"{ROW_START}{index}{ROW_END}"
+
+    # Emitted rows leave a marker in the output, rows rendered as one unit carry their cells between the markers
+    rows = []
+    emitted_values = iter(emitted)
+    for row in RENDERED_ROW.finditer(region.template.render(metadata, emit=emit)):
+        index, values = row.groups()
+        rows.append((styles[int(index)], next(emitted_values) if values is None else values.split(CELL_SEPARATOR)))
+
+    # Swap the template rows for the rendered rows, anything below the region moves with them
+    sheet.delete_rows(region.start, amount=region.end - region.start + 1)
+    if rows:
+        sheet.insert_rows(region.start, amount=len(rows))
+
+    # The style objects captured by the plan are shared, openpyxl never changes a style object once it is assigned
+    for i, (cell_styles, values) in enumerate(rows):
+        for j, value in enumerate(values):
+            cell = sheet.cell(row=region.start + i, column=j + 1)
+            cell.value = MULTIPLE_BLANK_LINES.sub("\n\n", f"{value}".replace("<w:br/>", "\n")).strip()
+            if j >= len(cell_styles):
+                continue
+
+            for name, style in cell_styles[j].items():
+                setattr(cell, name, style)
+
+
+def process_excel_template(wb, metadata=None, debug=False, plan=None):
+    if not metadata:
+        metadata = {}
+
+    if plan is None:
+        plan = build_render_plan(wb)
+
+    report_data = read_report(wb)
+    metadata.update(report_data)
+
+    # Render from the bottom up so the row numbers of the remaining regions stay valid
+    for region in sorted(plan.regions, key=lambda r: r.start, reverse=True):
         if debug:
-            print("Raw Template:\n" + raw_template.replace("-=+", ""))
-
-        jinga_template = Template(raw_template)
-        processed = jinga_template.render(metadata)
-
-        sheet.delete_rows(start + 1, amount=end - start + 1)
-
-        for i, row in enumerate(processed.splitlines()):
-            for j, c in enumerate(row.split("-=+")):
-                cell = sheet.cell(row=start + i + 1, column=j + 1)
-                cell.value = re.sub(r"\n\n+", "\n\n", c.replace("<w:br/>", "\n")).strip()
-                try:
-                    cell.font = copy(style[j]["font"])
-                    cell.border = copy(style[j]["border"])
-                    cell.fill = copy(style[j]["fill"])
-                    cell.number_format = copy(style[j]["number_format"])
-                    cell.protection = copy(style[j]["protection"])
-                    cell.alignment = copy(style[j]["alignment"])
-                except IndexError:
-                    pass
+            print("Raw Template:\n" + region.source)
+
+        render_region(wb[region.sheet], region, metadata)
 
     if debug and metadata:
         debugging_keys = debug_keys(metadata)
@@ -94,5 +156,3 @@ def process_excel_template(filename, metadata=None, debug=False):
         for i, key in enumerate(debugging_keys):
             cell = debug_sheet.cell(row=i + 1, column=1)
             cell.value = key
-
-    wb.save(filename)
@@ -8,15 +8,15 @@
 #
 #
 
+import hashlib
 import json
 import os
 import re
-import shutil
+from io import BytesIO
+from multiprocessing import Pool
 from urllib.parse import quote
 
 import click
-import requests
-import xlwings as xw
 from config import (
     YESTERDAY,
     CONTROL_SCORES,
@@ -28,22 +28,28 @@ from config import (
     SCORE_COLUMNS,
     SCORE_MAPPING,
     TAG_COLUMNS,
-    GAPS_SUMMARY,
+    SUMMARY_COLLECTIONS,
+    SUMMARY_STATISTICS,
     THIRD_PARTY_TABLE,
     MAPPED_CONTROLS_TABLE,
-    validation_label,
 )
-from ecosystem_utils import init_ecosystem_writer
-from excel_utils import process_excel_template
+from control_tree import rollup_variables
+from ecosystem_utils import init_ecosystem_writer, mapped_controls
+from excel_utils import build_render_plan, process_excel_template
+from formulas import evaluate_workbook, UnsupportedFormula
 from glom import glom, Coalesce
+from metrics import metrics_option, phase
 from openpyxl import load_workbook
-from openpyxl.cell import MergedCell
+from profiling import profile_option
 from reporting import create_report
+from summary import build_summary
+from telemetry import session, telemetry_option
+from template_cache import read_template
 from tqdm import tqdm
-from utils import sheet_writer, control_search, create_sheet
+from utils import sheet_writer, control_search, create_sheet, load_manifest, save_manifest
 
 
-def init_workbook(filename):
+def load_template(filename):
     wb = load_workbook(filename=filename)
 
     try:
@@ -56,23 +62,42 @@ def init_workbook(filename):
     for row in main:
         insert_controls.update(control_search({idx: col for idx, col in enumerate(row)}))
 
+    # Jinja loop regions of an Excel report are analyzed once, every vendor renders from this plan
+    render_plan = build_render_plan(wb)
+
     create_sheet(wb, CONTROL_SCORES)
     create_sheet(wb, GAPS_TABLE)
     create_sheet(wb, COMPANY_TAGS)
     create_sheet(wb, THIRD_PARTY_TABLE)
 
-    findings_writer = sheet_writer(wb, GAPS_TABLE, GAPS_COLUMNS)
-    scores_writer = sheet_writer(
-        wb, CONTROL_SCORES, SCORE_COLUMNS, mapping=SCORE_MAPPING, insert_controls=insert_controls
-    )
-    tags_writer = sheet_writer(wb, COMPANY_TAGS, TAG_COLUMNS)
-    third_party_writer = sheet_writer(wb, THIRD_PARTY_TABLE, TP_COLUMNS, mapping=TP_MAPPING)
+    # Keep the prepared template in memory, every vendor starts from a copy of these bytes
+    template = BytesIO()
+    wb.save(template)
+    raw_template = template.getvalue()
+    insert_controls = frozenset(insert_controls)
+
+    def init_workbook():
+        vendor_wb = load_workbook(filename=BytesIO(raw_template))
+
+        findings_writer = sheet_writer(vendor_wb, GAPS_TABLE, GAPS_COLUMNS)
+        scores_writer = sheet_writer(
+            vendor_wb, CONTROL_SCORES, SCORE_COLUMNS, mapping=SCORE_MAPPING, insert_controls=insert_controls
+        )
+        tags_writer = sheet_writer(vendor_wb, COMPANY_TAGS, TAG_COLUMNS)
+        third_party_writer = sheet_writer(vendor_wb, THIRD_PARTY_TABLE, TP_COLUMNS, mapping=TP_MAPPING)
 
-    return wb, scores_writer, findings_writer, tags_writer, third_party_writer
+        return vendor_wb, scores_writer, findings_writer, tags_writer, third_party_writer
 
+    init_workbook.insert_controls = insert_controls
+    init_workbook.render_plan = render_plan
+    return init_workbook
 
-def finalize_workbook(wb, excel_filename, debug=False):
-    temporary_filename = "temporary-workbook.xlsx"
+
+def calculate_with_excel(wb):
+    # Fallback for templates using formulas the built in evaluator does not support, requires a local Excel install
+    import xlwings as xw
+
+    temporary_filename = f"temporary-workbook-{os.getpid()}.xlsx"
     if os.path.exists(temporary_filename):
         os.remove(temporary_filename)
 
@@ -85,33 +110,142 @@ def finalize_workbook(wb, excel_filename, debug=False):
         temp_wb.save()
         temp_wb.close()
 
-        final_workbook = load_workbook(filename=temporary_filename, data_only=True)
-
-        # In not in debug mode remove computed values
-        if not debug:
-            # For every cell in the document write the value, this will be the computed formula because we opened using data_only=True
-            for _, sheet in enumerate(final_workbook):
-                for row in sheet:
-                    for cell in row:
-                        if isinstance(cell, MergedCell):
-                            continue
-                        cell.value = cell.value
-
-            # Remove supporting sheets
-            del final_workbook[CONTROL_SCORES]
-            del final_workbook[GAPS_TABLE]
-            del final_workbook[COMPANY_TAGS]
-
-        # Save a final copy
-        if os.path.exists(excel_filename):
-            os.remove(excel_filename)
-        final_workbook.save(excel_filename)
+        # Opening with data_only=True replaces every formula with the value Excel computed
+        return load_workbook(filename=temporary_filename, data_only=True)
     finally:
         # Clean up after ourselves
         if os.path.exists(temporary_filename):
             os.remove(temporary_filename)
 
 
+def finalize_workbook(wb, debug=False):
+    try:
+        # Compute every formula in place, this replaces each formula with its value
+        evaluate_workbook(wb)
+    except UnsupportedFormula as e:
+        print(f"{e}, falling back to Excel to calculate the workbook")
+        wb = calculate_with_excel(wb)
+
+    # If not in debug mode remove supporting sheets
+    if not debug:
+        del wb[CONTROL_SCORES]
+        del wb[GAPS_TABLE]
+        del wb[COMPANY_TAGS]
+
+    return wb
+
+
+def save_workbook(wb, excel_filename):
+    if os.path.exists(excel_filename):
+        os.remove(excel_filename)
+    wb.save(excel_filename)
+
+
+def render_vendor(init_workbook, tp, output_filename, report_template_name, excel_report, debug):
+    wb, scores_writer, findings_writer, tags_writer, third_party_writer = init_workbook()
+
+    with phase("write"):
+        for tag in glom(tp, Coalesce("tags", default=[])):
+            tags_writer({"tag": tag, "company_name": tp["name"]})
+
+        for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
+            findings_writer(finding)
+
+        for score in glom(tp, Coalesce("residual_risk.scores", default=[])):
+            scores_writer(score)
+
+        # Write third party metadata
+        third_party_writer(tp)
+
+        # Finalize each writer (fix width, ETC)
+        findings_writer.finalizer()
+        scores_writer.finalizer()
+        tags_writer.finalizer()
+        third_party_writer.finalizer()
+
+    # Reports add their data to the metadata, keep the caller's copy of the third party untouched
+    metadata = dict(tp)
+    metadata.update(rollup_variables(tp))
+
+    # The workbook stays in memory from here on, it is only written to disk once
+    with phase("finalize"):
+        wb = finalize_workbook(wb, debug=debug)
+
+    if excel_report:
+        with phase("render"):
+            process_excel_template(wb, metadata=metadata, debug=debug, plan=init_workbook.render_plan)
+        with phase("save"):
+            save_workbook(wb, f"{output_filename}.xlsx")
+    else:
+        with phase("save"):
+            save_workbook(wb, f"{output_filename}.xlsx")
+        with phase("render"):
+            create_report(wb, report_template_name, f"{output_filename}.docx", metadata=metadata, debug=debug)
+
+    return wb
+
+
+def collect_vendor(ecosystem_writer, tp, mapped_control_rows):
+    company_name = tp["name"]
+    for tag in glom(tp, Coalesce("tags", default=[])):
+        ecosystem_writer.tags_writer({"tag": tag, "company_name": company_name})
+
+    for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
+        ecosystem_writer.findings_writer(finding, tp["id"])
+
+    for score in glom(tp, Coalesce("residual_risk.scores", default=[])):
+        ecosystem_writer.scores_writer(score)
+
+    ecosystem_writer.third_party_writer(tp)
+    headers, rows = mapped_control_rows
+    ecosystem_writer.mapped_controls_writer(company_name, headers, rows)
+
+
+def vendor_hash(tp, template_hashes, excel_report, debug):
+    # Everything that goes into a vendor's reports, a vendor is only rendered again when one of these changes
+    inputs = hashlib.sha256(json.dumps(tp, sort_keys=True, default=str).encode("utf-8"))
+    for template_hash in template_hashes:
+        inputs.update(template_hash.encode("utf-8"))
+    inputs.update(f"excel_report={excel_report},debug={debug}".encode("utf-8"))
+
+    return f"sha256:{inputs.hexdigest()}"
+
+
+def report_files(output_filename, excel_report):
+    name = os.path.basename(output_filename)
+    return [f"{name}.xlsx"] if excel_report else [f"{name}.xlsx", f"{name}.docx"]
+
+
+def is_unchanged(manifest, output_dir, tp, input_hash):
+    previous = manifest.get(tp["id"])
+    if not previous or previous["hash"] != input_hash:
+        return False
+
+    return all(os.path.exists(os.path.join(output_dir, f)) for f in previous["files"])
+
+
+_worker_init_workbook = None
+_worker_collect_mapped_controls = False
+
+# Stands in for the Mapped Controls rows of a vendor when there is no ecosystem report to write them to
+NO_MAPPED_CONTROLS = ([], [])
+
+
+def init_vendor_worker(excel_template_name, collect_mapped_controls):
+    # Each worker process parses the template once
+    global _worker_init_workbook, _worker_collect_mapped_controls
+    _worker_init_workbook = load_template(excel_template_name)
+    _worker_collect_mapped_controls = collect_mapped_controls
+
+
+def render_vendor_worker(job):
+    tp, output_filename, report_template_name, excel_report, debug = job
+    wb = render_vendor(_worker_init_workbook, tp, output_filename, report_template_name, excel_report, debug)
+
+    # Workbooks do not cross process boundaries, only the Mapped Controls values are sent back for the ecosystem
+    return mapped_controls(wb) if _worker_collect_mapped_controls else NO_MAPPED_CONTROLS
+
+
 @click.command()
 @click.option(
     "--excel-template-name",
@@ -139,32 +273,71 @@ def finalize_workbook(wb, excel_filename, debug=False):
 @click.option(
     "--debug", help="Put the script into debug mode, extra data will be preserved in this mode", is_flag=True,
 )
-def map_analytics(excel_template_name, report_template_name, reports_from, ecosystem_template, excel_report, debug):
+@click.option(
+    "--workers", help="Render vendor reports in a pool of this many processes", default=1, type=int,
+)
+@click.option(
+    "--output-dir",
+    help="Write reports to this directory and only render vendors whose report or templates changed since the last run",
+    required=False,
+)
+@metrics_option
+@telemetry_option
+@profile_option
+def map_analytics(
+    excel_template_name,
+    report_template_name,
+    reports_from,
+    ecosystem_template,
+    excel_report,
+    debug,
+    workers,
+    output_dir,
+):
     if not os.path.exists(excel_template_name):
         raise Exception(f"The --excel-template-name={excel_template_name} does not exist")
 
     if not excel_report and not os.path.exists(report_template_name):
         raise Exception(f"The --report-template-name={report_template_name} does not exist")
 
-    for f in [f for f in os.listdir(".") if os.path.isfile(f)]:
-        if f in [excel_template_name, report_template_name, ecosystem_template]:
-            continue
+    manifest = {}
+    manifest_filename = None
+    if output_dir:
+        # Incremental mode, reports from earlier runs are kept and the manifest records what they were built from
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_filename = os.path.join(output_dir, "manifest.json")
+        manifest = load_manifest(manifest_filename)
+    else:
+        for f in [f for f in os.listdir(".") if os.path.isfile(f)]:
+            if f in [excel_template_name, report_template_name, ecosystem_template]:
+                continue
 
-        if os.path.splitext(f)[1] in [".xlsx", ".docx", ".json"]:
-            print(f"Cleaning up old report {f}")
-            os.remove(f)
+            if os.path.splitext(f)[1] in [".xlsx", ".docx", ".json"]:
+                print(f"Cleaning up old report {f}")
+                os.remove(f)
+
+    template_hashes = [read_template(excel_template_name)[1]]
+    if not excel_report:
+        template_hashes.append(read_template(report_template_name)[1])
 
     api = os.environ.get("CYBERGRX_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
     if not token:
         raise Exception("The environment variable CYBERGRX_API_TOKEN must be set")
 
-    ecosystem_writer = init_ecosystem_writer(ecosystem_template)
+    with phase("templates"):
+        ecosystem_writer = init_ecosystem_writer(ecosystem_template, os.path.join(output_dir or "", "ecosystem.xlsx"))
+        init_workbook = load_template(excel_template_name)
 
     uri = f"{api}/bulk-v1/third-parties?report_date={quote(reports_from)}"
     print(f"Fetching third parties from {uri} this can take some time.")
-    response = requests.get(uri, headers={"Authorization": token.strip()})
-    result = json.loads(response.content.decode("utf-8"))
+    with phase("fetch"):
+        response = session.get(uri, headers={"Authorization": token.strip()})
+    with phase("parse") as count:
+        result = json.loads(response.content.decode("utf-8"))
+        count(len(result))
+
+    summarize = build_summary(SUMMARY_STATISTICS, SUMMARY_COLLECTIONS)
 
     def write_tp_if_debug(third_party, json_file):
         if debug:
@@ -172,77 +345,107 @@ def map_analytics(excel_template_name, report_template_name, reports_from, ecosy
                 debug_file.write(json.dumps(third_party, indent=2))
 
     print(f"Retrieved {str(len(result))} third parties from your ecosystem, building an excel.")
-    for tp in tqdm(result, total=len(result), desc="Third Party"):
-        company_name = tp["name"]
-        report_date = glom(tp, Coalesce("residual_risk.date", default=""))
-        output_filename = f'{re.sub("[^A-Za-z0-9 &]+", "", company_name).replace(" ", "-")}_{report_date}'
-
-        scores = glom(tp, Coalesce("residual_risk.scores", default=[]))
-        if not scores:
-            if debug:
-                print(f"{company_name} did not have any residual_risk scores.")
-
-            write_tp_if_debug(tp, f"{output_filename}.json")
-            continue
-
-        tier = glom(tp, Coalesce("residual_risk.tier", default=0))
-        if tier not in [1, 2]:
-            print(f"{company_name} had a T{tier} report, this tier is not supported.")
-            write_tp_if_debug(tp, f"{output_filename}.json")
-            continue
-
-        # Inject gaps summary into the TP
-        tp.update(glom(tp, Coalesce(GAPS_SUMMARY, default={})))
-
-        if glom(tp, Coalesce("subscription.is_validated", default=False)):
-            all_missing = True
-            for score in scores:
-                if glom(score, (Coalesce("validation_state", default=None), validation_label)) != "Not Reviewed":
-                    all_missing = False
-                    break
+    jobs = []
+    with phase("transform") as count:
+        for tp in result:
+            count()
+            company_name = tp["name"]
+            report_date = glom(tp, Coalesce("residual_risk.date", default=""))
+            output_filename = f'{re.sub("[^A-Za-z0-9 &]+", "", company_name).replace(" ", "-")}_{report_date}'
+            output_filename = os.path.join(output_dir or "", output_filename)
+            # Only hashed for the manifest, which is only kept with --output-dir
+            input_hash = vendor_hash(tp, template_hashes, excel_report, debug) if output_dir else None
+
+            scores = glom(tp, Coalesce("residual_risk.scores", default=[]))
+            if not scores:
+                if debug:
+                    print(f"{company_name} did not have any residual_risk scores.")
 
-            if all_missing and len(scores) > 0:
-                print(f"{company_name} had a T{tier} report, but validation_states are all Not Reviewed.")
                 write_tp_if_debug(tp, f"{output_filename}.json")
                 continue
 
-        wb, scores_writer, findings_writer, tags_writer, third_party_writer = init_workbook(excel_template_name)
-
-        for tag in glom(tp, Coalesce("tags", default=[])):
-            tag_meta = {"tag": tag, "company_name": company_name}
-            tags_writer(tag_meta)
-            ecosystem_writer.tags_writer(tag_meta)
+            tier = glom(tp, Coalesce("residual_risk.tier", default=0))
+            if tier not in [1, 2]:
+                print(f"{company_name} had a T{tier} report, this tier is not supported.")
+                write_tp_if_debug(tp, f"{output_filename}.json")
+                continue
 
-        for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
-            finding["company_name"] = company_name
-            findings_writer(finding)
-            ecosystem_writer.findings_writer(finding)
+            # Inject the summary statistics into the TP, all of them come from one pass over the findings and scores
+            summary = summarize(tp)
+            tp.update(summary)
 
-        for score in scores:
-            score["company_name"] = company_name
-            scores_writer(score)
-            ecosystem_writer.scores_writer(score)
+            if glom(tp, Coalesce("subscription.is_validated", default=False)):
+                if summary["total_scores"] > 0 and summary["total_not_reviewed_scores"] == summary["total_scores"]:
+                    print(f"{company_name} had a T{tier} report, but validation_states are all Not Reviewed.")
+                    write_tp_if_debug(tp, f"{output_filename}.json")
+                    continue
 
-        # Write third party metadata
-        third_party_writer(tp)
-        ecosystem_writer.third_party_writer(tp)
+            for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
+                finding["company_name"] = company_name
 
-        # Finalize each writer (fix width, ETC)
-        findings_writer.finalizer()
-        scores_writer.finalizer()
-        tags_writer.finalizer()
-        third_party_writer.finalizer()
+            for score in scores:
+                score["company_name"] = company_name
+
+            unchanged = output_dir and is_unchanged(manifest, output_dir, tp, input_hash)
+            jobs.append((tp, output_filename, input_hash, unchanged))
+
+    if output_dir:
+        print(f"{len([j for j in jobs if j[3]])} third parties are unchanged since the last run and will be skipped.")
+
+    def record_vendor(tp, output_filename, input_hash):
+        if not output_dir:
+            return
+
+        # Remove reports from a previous version of this vendor's report that were written under another name
+        files = report_files(output_filename, excel_report)
+        previous = manifest.get(tp["id"], {}).get("files", [])
+        for f in [f for f in previous if f not in files and os.path.exists(os.path.join(output_dir, f))]:
+            os.remove(os.path.join(output_dir, f))
+
+        # Saved after every vendor so a run that stops part way through resumes from here
+        manifest[tp["id"]] = {"name": tp["name"], "hash": input_hash, "files": files}
+        save_manifest(manifest_filename, manifest)
+
+    render_jobs = [
+        (tp, output_filename, report_template_name, excel_report, debug)
+        for tp, output_filename, _, unchanged in jobs
+        if not unchanged
+    ]
+
+    pool = None
+    if workers > 1:
+        # Vendors are rendered in a process pool, results come back in order and the ecosystem is written here
+        initargs = (excel_template_name, ecosystem_writer.active)
+        pool = Pool(workers, initializer=init_vendor_worker, initargs=initargs)
+        rendered_vendors = pool.imap(render_vendor_worker, render_jobs)
+    else:
+        # The Mapped Controls rows are only read back when there is an ecosystem report to write them to
+        rendered_vendors = (
+            mapped_controls(wb) if ecosystem_writer.active else NO_MAPPED_CONTROLS
+            for wb in (render_vendor(init_workbook, *job) for job in render_jobs)
+        )
 
-        excel_filename = f"{output_filename}.xlsx"
-        finalize_workbook(wb, excel_filename, debug=debug)
-        if excel_report:
-            process_excel_template(excel_filename, metadata=tp, debug=debug)
-        else:
-            create_report(excel_filename, report_template_name, f"{output_filename}.docx", metadata=tp, debug=debug)
+    try:
+        for tp, output_filename, input_hash, unchanged in tqdm(jobs, total=len(jobs), desc="Third Party"):
+            if unchanged:
+                # Reuse the workbook from an earlier run for the ecosystem report
+                with phase("ecosystem", items=1):
+                    if ecosystem_writer.active:
+                        collect_vendor(ecosystem_writer, tp, mapped_controls(f"{output_filename}.xlsx"))
+                continue
 
-        ecosystem_writer.process_excel(excel_filename, company_name)
+            # With --workers this is the time spent waiting on the pool, the vendor breakdown is only recorded serially
+            with phase("vendors", items=1):
+                mapped_control_rows = next(rendered_vendors)
+            record_vendor(tp, output_filename, input_hash)
+            with phase("ecosystem", items=1):
+                collect_vendor(ecosystem_writer, tp, mapped_control_rows)
+    finally:
+        if pool:
+            pool.terminate()
 
-    ecosystem_writer.finalizer()
+    with phase("save"):
+        ecosystem_writer.finalizer()
 
 
 @click.command()
@@ -255,6 +458,8 @@ def map_analytics(excel_template_name, report_template_name, reports_from, ecosy
 @click.option(
     "--debug-json", help="Process this debug JSON and create a new report", required=True,
 )
+@metrics_option
+@profile_option
 def run_excel_template(excel_template_name, debug_json):
     if not os.path.exists(excel_template_name):
         raise Exception(f"{excel_template_name} does not exist.")
@@ -268,9 +473,12 @@ def run_excel_template(excel_template_name, debug_json):
     json_filename = os.path.basename(debug_json)
     excel_filename = f"{os.path.splitext(json_filename)[0]}.xlsx"
 
-    shutil.copyfile(excel_template_name, excel_filename)
-
-    process_excel_template(excel_filename, metadata=metadata, debug=True)
+    with phase("templates"):
+        wb = load_workbook(filename=excel_template_name, data_only=True)
+    with phase("render"):
+        process_excel_template(wb, metadata=metadata, debug=True)
+    with phase("save"):
+        save_workbook(wb, excel_filename)
 
 
 @click.command()
@@ -280,6 +488,8 @@ def run_excel_template(excel_template_name, debug_json):
 @click.option(
     "--excel-report-name", help="Process this excel report and generate a word document", required=True,
 )
+@metrics_option
+@profile_option
 def excel_to_report(excel_report_name, report_template_name):
     file_name = os.path.basename(excel_report_name)
 
@@ -289,13 +499,14 @@ def excel_to_report(excel_report_name, report_template_name):
         with open(json_file) as f:
             metadata = json.load(f)
 
-    create_report(
-        excel_report_name,
-        report_template_name,
-        f"{os.path.splitext(file_name)[0]}.docx",
-        metadata=metadata,
-        debug=False,
-    )
+    with phase("render"):
+        create_report(
+            excel_report_name,
+            report_template_name,
+            f"{os.path.splitext(file_name)[0]}.docx",
+            metadata=metadata,
+            debug=False,
+        )
 
 
 @click.command()
@@ -305,11 +516,15 @@ def excel_to_report(excel_report_name, report_template_name):
     required=False,
     default="excel-template.xlsx",
 )
+@metrics_option
+@profile_option
 def test_excel_template(excel_template_name):
     if not os.path.exists(excel_template_name):
         raise Exception(f"The --excel-template-name={excel_template_name} does not exist")
 
-    init_workbook(excel_template_name)
+    with phase("templates"):
+        init_workbook = load_template(excel_template_name)
+        init_workbook()
 
 
 @click.group()
@@ -0,0 +1,630 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import re
+from functools import lru_cache
+
+from openpyxl.cell import MergedCell
+from openpyxl.utils import column_index_from_string
+
+# A pure Python evaluator for the formula subset the mapping templates use (VLOOKUP into the Answers sheet wrapped in
+# IF/IFERROR and concatenation).  Anything outside of the subset raises UnsupportedFormula so the caller can fall
+# back to letting Excel calculate the workbook.
+
+_TOKEN_REGEX = re.compile(
+    r"""\s*(?:
+    (?P<string>"(?:[^"]|"")*")|
+    (?P<error>\#(?:N/A|VALUE!|REF!|DIV/0!|NUM!|NAME\?|NULL!))|
+    (?P<function>(?:_xlfn\.)?[A-Za-z][A-Za-z0-9.]*)\s*\(|
+    (?P<ref>(?:(?P<sheet>'(?:[^']|'')+'|[A-Za-z0-9_.]+)!)?
+        (?P<area>\$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}))
+        (?![A-Za-z0-9_(])|
+    (?P<bool>TRUE|FALSE)(?![A-Za-z0-9_(])|
+    (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)|
+    (?P<operator><>|<=|>=|[-+*/^&=<>%(),])
+    )""",
+    re.VERBOSE,
+)
+
+_CELL_REGEX = re.compile(r"^\$?(?P<column>[A-Za-z]{1,3})\$?(?P<row>\d+)?$")
+
+_COMPARISONS = ["=", "<>", "<", ">", "<=", ">="]
+
+# Excel wildcards in exact match lookups, ~ escapes the next character
+_WILDCARD_REGEX = re.compile(r"~(.)|(\*)|(\?)|(.)", re.DOTALL)
+
+
+class UnsupportedFormula(Exception):
+    pass
+
+
+class ExcelError(object):
+    def __init__(self, code):
+        self.code = code
+
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+    def __repr__(self):
+        return self.code
+
+
+NA = ExcelError("#N/A")
+VALUE = ExcelError("#VALUE!")
+DIV0 = ExcelError("#DIV/0!")
+REF = ExcelError("#REF!")
+
+
+class _Raise(Exception):
+    def __init__(self, error):
+        super().__init__(error.code)
+        self.error = error
+
+
+def _tokenize(formula):
+    tokens = []
+    position = 0
+    text = formula.strip()
+    while position < len(text):
+        match = _TOKEN_REGEX.match(text, position)
+        if not match or match.end() == position:
+            if text[position:].strip() == "":
+                break
+            raise UnsupportedFormula(f"Unable to parse {formula}")
+
+        position = match.end()
+        kind = next(k for k in ["string", "error", "function", "ref", "bool", "number", "operator"] if match.group(k))
+        tokens.append((kind, match))
+
+    return tokens
+
+
+def _area(sheet, area):
+    if sheet and sheet.startswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+
+    start, _, end = area.partition(":")
+    start = _CELL_REGEX.match(start)
+    end = _CELL_REGEX.match(end if end else area)
+
+    min_row = int(start.group("row")) if start.group("row") else None
+    max_row = int(end.group("row")) if end.group("row") else None
+    return (
+        "ref",
+        sheet,
+        min_row,
+        column_index_from_string(start.group("column").upper()),
+        max_row,
+        column_index_from_string(end.group("column").upper()),
+    )
+
+
+class _Parser(object):
+    def __init__(self, formula):
+        self.formula = formula
+        self.tokens = _tokenize(formula)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def operator(self):
+        kind, match = self.peek()
+        return match.group("operator") if kind == "operator" else None
+
+    def expect(self, operator):
+        if self.operator() != operator:
+            raise UnsupportedFormula(f"Expected {operator} in {self.formula}")
+        self.position += 1
+
+    def parse(self):
+        expression = self.comparison()
+        if self.position != len(self.tokens):
+            raise UnsupportedFormula(f"Unable to parse {self.formula}")
+
+        return expression
+
+    def comparison(self):
+        left = self.concatenation()
+        while self.operator() in _COMPARISONS:
+            op = self.operator()
+            self.position += 1
+            left = ("binary", op, left, self.concatenation())
+        return left
+
+    def concatenation(self):
+        left = self.additive()
+        while self.operator() == "&":
+            self.position += 1
+            left = ("binary", "&", left, self.additive())
+        return left
+
+    def additive(self):
+        left = self.multiplicative()
+        while self.operator() in ["+", "-"]:
+            op = self.operator()
+            self.position += 1
+            left = ("binary", op, left, self.multiplicative())
+        return left
+
+    def multiplicative(self):
+        left = self.power()
+        while self.operator() in ["*", "/"]:
+            op = self.operator()
+            self.position += 1
+            left = ("binary", op, left, self.power())
+        return left
+
+    def power(self):
+        left = self.unary()
+        while self.operator() == "^":
+            self.position += 1
+            left = ("binary", "^", left, self.unary())
+        return left
+
+    def unary(self):
+        if self.operator() in ["-", "+"]:
+            op = self.operator()
+            self.position += 1
+            operand = self.unary()
+            return ("negate", operand) if op == "-" else operand
+
+        operand = self.primary()
+        while self.operator() == "%":
+            self.position += 1
+            operand = ("binary", "/", operand, ("value", 100))
+        return operand
+
+    def primary(self):
+        kind, match = self.peek()
+        if kind is None:
+            raise UnsupportedFormula(f"Unexpected end of {self.formula}")
+
+        self.position += 1
+        if kind == "string":
+            return ("value", match.group("string")[1:-1].replace('""', '"'))
+        if kind == "number":
+            number = float(match.group("number"))
+            return ("value", int(number) if number.is_integer() else number)
+        if kind == "bool":
+            return ("value", match.group("bool") == "TRUE")
+        if kind == "error":
+            return ("value", ExcelError(match.group("error")))
+        if kind == "ref":
+            return _area(match.group("sheet"), match.group("area"))
+        if kind == "function":
+            name = match.group("function").upper().replace("_XLFN.", "")
+            args = []
+            if self.operator() != ")":
+                args.append(self.comparison())
+                while self.operator() == ",":
+                    self.position += 1
+                    args.append(self.comparison())
+            self.expect(")")
+            return ("call", name, args)
+        if kind == "operator" and match.group("operator") == "(":
+            expression = self.comparison()
+            self.expect(")")
+            return expression
+
+        raise UnsupportedFormula(f"Unable to parse {self.formula}")
+
+
+@lru_cache(maxsize=65536)
+def parse_formula(formula):
+    return _Parser(formula[1:] if formula.startswith("=") else formula).parse()
+
+
+def _is_formula(cell):
+    return cell.data_type == "f" and isinstance(cell.value, str) and cell.value.startswith("=")
+
+
+def _number(value):
+    if isinstance(value, ExcelError):
+        raise _Raise(value)
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if isinstance(value, (int, float)):
+        return value
+
+    try:
+        number = float(f"{value}".strip())
+        return int(number) if number.is_integer() else number
+    except ValueError:
+        raise _Raise(VALUE)
+
+
+def _text(value):
+    if isinstance(value, ExcelError):
+        raise _Raise(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return f"{value:.15g}"
+
+    return f"{value}"
+
+
+def _boolean(value):
+    if isinstance(value, ExcelError):
+        raise _Raise(value)
+    if value is None:
+        return False
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    if f"{value}".upper() in ["TRUE", "FALSE"]:
+        return f"{value}".upper() == "TRUE"
+
+    raise _Raise(VALUE)
+
+
+def _key(value):
+    # Excel matches text case insensitively and does not distinguish integers from floats
+    if isinstance(value, str):
+        return (1, value.lower())
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, (int, float)):
+        return (0, float(value))
+
+    return (3, _text(value).lower())
+
+
+def _wildcard(lookup):
+    # Only text lookups that contain a wildcard are matched as a pattern, anything else is matched as a key
+    if not isinstance(lookup, str) or not any(c in lookup for c in "*?~"):
+        return None
+
+    pattern = ""
+    for escaped, star, question, literal in _WILDCARD_REGEX.findall(lookup):
+        if star:
+            pattern += ".*"
+        elif question:
+            pattern += "."
+        else:
+            pattern += re.escape(escaped or literal)
+
+    return re.compile(pattern, re.IGNORECASE | re.DOTALL)
+
+
+def _compare(op, left, right):
+    if isinstance(left, ExcelError):
+        raise _Raise(left)
+    if isinstance(right, ExcelError):
+        raise _Raise(right)
+
+    # Blank cells compare as 0 against numbers and as "" against text
+    if left is None:
+        left = "" if isinstance(right, str) else (False if isinstance(right, bool) else 0)
+    if right is None:
+        right = "" if isinstance(left, str) else (False if isinstance(left, bool) else 0)
+
+    left, right = _key(left), _key(right)
+    return {
+        "=": left == right,
+        "<>": left != right,
+        "<": left < right,
+        ">": left > right,
+        "<=": left <= right,
+        ">=": left >= right,
+    }[op]
+
+
+class WorkbookEvaluator(object):
+    def __init__(self, wb):
+        self.wb = wb
+        self.values = {}
+        self.pending = set()
+        self.indexes = {}
+
+    def sheet(self, name, current):
+        try:
+            return self.wb[name] if name else current
+        except KeyError:
+            raise _Raise(REF)
+
+    def bounds(self, ref, current):
+        _, name, min_row, min_col, max_row, max_col = ref
+        sheet = self.sheet(name, current)
+        return sheet, min_row if min_row else 1, min_col, max_row if max_row else sheet.max_row, max_col
+
+    def cell_value(self, sheet, row, column):
+        key = (sheet.title, row, column)
+        if key in self.values:
+            return self.values[key]
+
+        # sheet.cell() would create every cell a lookup range touches, only existing cells are read
+        cell = sheet._cells.get((row, column))
+        if cell is None or isinstance(cell, MergedCell):
+            return None
+        if not _is_formula(cell):
+            return cell.value
+
+        if key in self.pending:
+            raise UnsupportedFormula(f"Circular reference in {sheet.title}!{cell.coordinate}")
+
+        self.pending.add(key)
+        try:
+            value = self.scalar(parse_formula(cell.value), sheet)
+        except _Raise as e:
+            value = e.error
+        finally:
+            self.pending.discard(key)
+
+        # Excel shows a reference to an empty cell as 0
+        value = 0 if value is None else value
+
+        self.values[key] = value
+        return value
+
+    def single(self, ref, current):
+        sheet, min_row, min_col, max_row, max_col = self.bounds(ref, current)
+        if min_row != max_row or min_col != max_col:
+            raise UnsupportedFormula(f"Range used as a single value in {ref}")
+
+        return self.cell_value(sheet, min_row, min_col)
+
+    def scalar(self, node, current):
+        value = self.evaluate(node, current)
+        return self.single(value, current) if isinstance(value, tuple) else value
+
+    def range_values(self, node, current):
+        value = self.evaluate(node, current)
+        if not isinstance(value, tuple):
+            return [value]
+
+        sheet, min_row, min_col, max_row, max_col = self.bounds(value, current)
+        rows = range(min_row, min(max_row, sheet.max_row) + 1)
+        columns = range(min_col, min(max_col, sheet.max_column) + 1)
+        return [self.cell_value(sheet, r, c) for r in rows for c in columns]
+
+    def index(self, sheet, min_row, max_row, column):
+        # Hash index over the lookup column, first match wins just like Excel.  Rows past the end of the sheet are
+        # empty, so whole column ranges only scan the rows that exist.
+        key = (sheet.title, min_row, max_row, column)
+        if key not in self.indexes:
+            index = {}
+            for row in range(min_row, min(max_row, sheet.max_row) + 1):
+                value = self.cell_value(sheet, row, column)
+                if value is not None:
+                    index.setdefault(_key(value), row)
+            self.indexes[key] = index
+
+        return self.indexes[key]
+
+    def exact_row(self, lookup, sheet, min_row, max_row, column):
+        pattern = _wildcard(lookup)
+        if not pattern:
+            return self.index(sheet, min_row, max_row, column).get(_key(lookup))
+
+        # Wildcards only match text, the first matching row wins
+        for row in range(min_row, min(max_row, sheet.max_row) + 1):
+            value = self.cell_value(sheet, row, column)
+            if isinstance(value, str) and pattern.fullmatch(value):
+                return row
+
+        return None
+
+    def vlookup(self, args, current):
+        if len(args) not in [3, 4]:
+            raise UnsupportedFormula("VLOOKUP takes 3 or 4 arguments")
+
+        lookup = self.scalar(args[0], current)
+        if isinstance(lookup, ExcelError):
+            raise _Raise(lookup)
+
+        table = self.evaluate(args[1], current)
+        if not isinstance(table, tuple):
+            raise _Raise(VALUE)
+
+        sheet, min_row, min_col, max_row, max_col = self.bounds(table, current)
+        column = int(_number(self.scalar(args[2], current)))
+        if column < 1:
+            raise _Raise(VALUE)
+        if column > max_col - min_col + 1:
+            raise _Raise(REF)
+
+        exact = len(args) == 4 and not _boolean(self.scalar(args[3], current))
+        if exact:
+            row = self.exact_row(lookup, sheet, min_row, max_row, min_col)
+        else:
+            # Approximate match, the last row that is less than or equal to the lookup value
+            row = None
+            for r in range(min_row, min(max_row, sheet.max_row) + 1):
+                value = self.cell_value(sheet, r, min_col)
+                if value is None or _key(value)[0] != _key(lookup)[0]:
+                    continue
+                if _key(value) > _key(lookup):
+                    break
+                row = r
+
+        if row is None:
+            raise _Raise(NA)
+
+        return self.cell_value(sheet, row, min_col + column - 1)
+
+    def match(self, args, current):
+        if len(args) != 3 or _number(self.scalar(args[2], current)) != 0:
+            raise UnsupportedFormula("Only exact MATCH(value, range, 0) is supported")
+
+        lookup = self.scalar(args[0], current)
+        table = self.evaluate(args[1], current)
+        sheet, min_row, min_col, max_row, max_col = self.bounds(table, current)
+        if min_col != max_col:
+            raise UnsupportedFormula("MATCH is only supported over a single column")
+
+        row = self.exact_row(lookup, sheet, min_row, max_row, min_col)
+        if row is None:
+            raise _Raise(NA)
+
+        return row - min_row + 1
+
+    def index_function(self, args, current):
+        table = self.evaluate(args[0], current)
+        sheet, min_row, min_col, max_row, max_col = self.bounds(table, current)
+        row = int(_number(self.scalar(args[1], current)))
+        column = int(_number(self.scalar(args[2], current))) if len(args) > 2 else 1
+        if row < 1 or column < 1 or row > max_row - min_row + 1 or column > max_col - min_col + 1:
+            raise _Raise(REF)
+
+        return self.cell_value(sheet, min_row + row - 1, min_col + column - 1)
+
+    def call(self, name, args, current):
+        if name == "VLOOKUP":
+            return self.vlookup(args, current)
+        if name == "MATCH":
+            return self.match(args, current)
+        if name == "INDEX":
+            return self.index_function(args, current)
+
+        if name == "IF":
+            if len(args) not in [2, 3]:
+                raise UnsupportedFormula("IF takes 2 or 3 arguments")
+            if _boolean(self.scalar(args[0], current)):
+                return self.scalar(args[1], current)
+            return self.scalar(args[2], current) if len(args) == 3 else False
+
+        if name in ["IFERROR", "IFNA"]:
+            try:
+                value = self.scalar(args[0], current)
+            except _Raise as e:
+                value = e.error
+            if isinstance(value, ExcelError) and (name == "IFERROR" or value == NA):
+                return self.scalar(args[1], current)
+            return value
+
+        if name in ["ISERROR", "ISNA"]:
+            try:
+                value = self.scalar(args[0], current)
+            except _Raise as e:
+                value = e.error
+            return isinstance(value, ExcelError) and (name == "ISERROR" or value == NA)
+
+        if name == "AND":
+            return all(_boolean(v) for a in args for v in self.range_values(a, current) if v is not None)
+        if name == "OR":
+            return any(_boolean(v) for a in args for v in self.range_values(a, current) if v is not None)
+
+        if name in ["SUM", "AVERAGE", "MIN", "MAX", "COUNT", "COUNTA"]:
+            return self.aggregate(name, args, current)
+
+        values = [self.scalar(a, current) for a in args]
+        if name == "NOT":
+            return not _boolean(values[0])
+        if name == "ISBLANK":
+            return values[0] is None
+        if name == "ISNUMBER":
+            return isinstance(values[0], (int, float)) and not isinstance(values[0], bool)
+        if name == "ISTEXT":
+            return isinstance(values[0], str)
+        if name in ["CONCATENATE", "CONCAT"]:
+            return "".join(_text(v) for v in values)
+        if name == "LEN":
+            return len(_text(values[0]))
+        if name == "TRIM":
+            return " ".join(_text(values[0]).split())
+        if name == "UPPER":
+            return _text(values[0]).upper()
+        if name == "LOWER":
+            return _text(values[0]).lower()
+        if name == "LEFT":
+            return _text(values[0])[: int(_number(values[1])) if len(values) > 1 else 1]
+        if name == "RIGHT":
+            count = int(_number(values[1])) if len(values) > 1 else 1
+            return _text(values[0])[-count:] if count else ""
+        if name == "VALUE":
+            return _number(values[0])
+        if name == "ROUND":
+            return round(_number(values[0]), int(_number(values[1])))
+
+        raise UnsupportedFormula(f"The function {name} is not supported")
+
+    def aggregate(self, name, args, current):
+        flattened = [v for a in args for v in self.range_values(a, current)]
+        if name == "COUNTA":
+            return len([v for v in flattened if v is not None])
+
+        for v in flattened:
+            if isinstance(v, ExcelError):
+                raise _Raise(v)
+
+        numbers = [v for v in flattened if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        if name == "COUNT":
+            return len(numbers)
+        if name == "SUM":
+            return sum(numbers)
+        if name == "AVERAGE":
+            if not numbers:
+                raise _Raise(DIV0)
+            return sum(numbers) / len(numbers)
+        if not numbers:
+            return 0
+        return min(numbers) if name == "MIN" else max(numbers)
+
+    def evaluate(self, node, current):
+        kind = node[0]
+        if kind == "value":
+            return node[1]
+        if kind == "ref":
+            return node
+        if kind == "call":
+            return self.call(node[1], node[2], current)
+        if kind == "negate":
+            return -_number(self.scalar(node[1], current))
+
+        _, op, left, right = node
+        left = self.scalar(left, current)
+        right = self.scalar(right, current)
+        if op == "&":
+            return _text(left) + _text(right)
+        if op in _COMPARISONS:
+            return _compare(op, left, right)
+
+        left, right = _number(left), _number(right)
+        if op == "+":
+            return left + right
+        if op == "-":
+            return left - right
+        if op == "*":
+            return left * right
+        if op == "^":
+            return left ** right
+        if right == 0:
+            raise _Raise(DIV0)
+        return left / right
+
+    def formula_value(self, sheet, row, column):
+        value = self.cell_value(sheet, row, column)
+        return value.code if isinstance(value, ExcelError) else value
+
+
+def evaluate_workbook(wb):
+    evaluator = WorkbookEvaluator(wb)
+
+    formula_cells = []
+    for _, sheet in enumerate(wb):
+        for row in sheet.iter_rows():
+            for cell in row:
+                if not isinstance(cell, MergedCell) and _is_formula(cell):
+                    formula_cells.append((sheet, cell))
+
+    # Compute everything before writing so formulas that reference other formulas see a consistent workbook
+    computed = [(cell, evaluator.formula_value(sheet, cell.row, cell.column)) for sheet, cell in formula_cells]
+    for cell, value in computed:
+        cell.value = value
+
+    return len(computed)
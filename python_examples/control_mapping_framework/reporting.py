@@ -12,11 +12,12 @@ import logging
 import os
 import re
 from collections import defaultdict
+from functools import lru_cache
 
 import stringcase
-from docxtpl import DocxTemplate
-from jinja2 import Environment, DebugUndefined
+from jinja2 import DebugUndefined
 from openpyxl import load_workbook
+from template_cache import docx_template_variables, load_docx_template
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +43,8 @@ def clean_value(raw):
 
 
 def read_report(excel_file):
-    wb = load_workbook(excel_file)
+    # Accepts a filename or a workbook that is already in memory
+    wb = load_workbook(excel_file) if isinstance(excel_file, str) else excel_file
 
     report = defaultdict(list)
     for _, s in enumerate(wb):
@@ -58,30 +60,36 @@ def read_report(excel_file):
     return report
 
 
-def debug_keys(obj, prefix=None):
-    results = []
-
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            if isinstance(v, dict):
-                for r in debug_keys(v, prefix=f"{prefix if prefix else ''}{k}."):
-                    if r not in results:
-                        results.append(r)
-            elif isinstance(v, list):
-                for vv in v:
-                    for r in debug_keys(vv, prefix=f"{prefix if prefix else ''}{k}[]"):
-                        if r not in results:
-                            results.append(r)
-            else:
-                result = f"{prefix if prefix else ''}{k}"
-                if result not in results:
-                    results.append(result)
-    else:
-        result = f"{prefix if prefix else ''}"
-        if result not in results:
-            results.append(result)
+@lru_cache(maxsize=None)
+def _flat_keys(prefix, shape):
+    return tuple(f"{prefix}{k}" for k in shape)
+
+
+def _collect_keys(obj, prefix, keys):
+    if not isinstance(obj, dict):
+        keys[prefix] = None
+        return
+
+    # Scores, findings and most other lists hold flat dicts with the same keys, their key names are only built once
+    if not any(isinstance(v, (dict, list)) for v in obj.values()):
+        keys.update(dict.fromkeys(_flat_keys(prefix, tuple(obj))))
+        return
 
-    return results
+    for k, v in obj.items():
+        if isinstance(v, dict):
+            _collect_keys(v, f"{prefix}{k}.", keys)
+        elif isinstance(v, list):
+            for vv in v:
+                _collect_keys(vv, f"{prefix}{k}[]", keys)
+        else:
+            keys[f"{prefix}{k}"] = None
+
+
+def debug_keys(obj, prefix=None):
+    # A dict keeps the keys in the order they were first seen and makes each membership check constant time
+    keys = {}
+    _collect_keys(obj, prefix if prefix else "", keys)
+    return list(keys)
 
 
 def create_report(excel_file, doc_template, output_name, metadata=None, debug=False):
@@ -90,16 +98,20 @@ def create_report(excel_file, doc_template, output_name, metadata=None, debug=Fa
 
     report_data = read_report(excel_file)
     metadata.update(report_data)
-    debugging_keys = debug_keys(metadata)
-    debugging_keys.sort()
-    metadata["debug"] = "<w:br/>".join(debugging_keys)
+
+    # The key listing is only built for templates that show it
+    variables = docx_template_variables(doc_template)
+    if variables is None or "debug" in variables:
+        debugging_keys = debug_keys(metadata)
+        debugging_keys.sort()
+        metadata["debug"] = "<w:br/>".join(debugging_keys)
 
     if debug:
         with open(f"{os.path.splitext(output_name)[0]}.json", "w") as f:
             f.write(json.dumps(metadata, indent=2))
 
-    template = DocxTemplate(doc_template)
-    template.render(metadata, Environment(undefined=SilentUndefined))
+    template, environment = load_docx_template(doc_template, undefined=SilentUndefined)
+    template.render(metadata, environment)
 
     # Wipe the report if it exists
     if os.path.exists(output_name):
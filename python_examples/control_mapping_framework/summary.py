@@ -0,0 +1,127 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+from collections import defaultdict
+
+from glom import glom, Coalesce
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def count(match=None):
+    total = 0
+
+    def update(value):
+        nonlocal total
+        if match is None or value == match:
+            total += 1
+
+    update.result = lambda: total
+    return update
+
+
+def distribution(match=None):
+    counts = {}
+
+    def update(value):
+        counts[value] = counts.get(value, 0) + 1
+
+    update.result = lambda: counts
+    return update
+
+
+def mean(match=None):
+    total = 0
+    values = 0
+
+    def update(value):
+        nonlocal total, values
+        if _is_number(value):
+            total += value
+            values += 1
+
+    update.result = lambda: total / values if values else None
+    return update
+
+
+def minimum(match=None):
+    current = None
+
+    def update(value):
+        nonlocal current
+        if _is_number(value) and (current is None or value < current):
+            current = value
+
+    update.result = lambda: current
+    return update
+
+
+def maximum(match=None):
+    current = None
+
+    def update(value):
+        nonlocal current
+        if _is_number(value) and (current is None or value > current):
+            current = value
+
+    update.result = lambda: current
+    return update
+
+
+AGGREGATIONS = {
+    "count": count,
+    "distribution": distribution,
+    "mean": mean,
+    "min": minimum,
+    "max": maximum,
+}
+
+
+def _getter(field):
+    if field is None:
+        return lambda item: item
+
+    if callable(field):
+        return field
+
+    return lambda item: item.get(field) if isinstance(item, dict) else None
+
+
+def build_summary(statistics, collections):
+    # statistics maps an output key to [collection, aggregation, field, match], the spec is read once and every
+    # statistic over the same collection is computed in a single traversal of that collection
+    plan = defaultdict(list)
+    for name, spec in statistics.items():
+        collection, aggregation = spec[0], spec[1]
+        field = spec[2] if len(spec) > 2 else None
+        match = spec[3] if len(spec) > 3 else None
+
+        if collection not in collections:
+            raise Exception(f"The summary statistic {name} uses an unknown collection {collection}")
+        if aggregation not in AGGREGATIONS:
+            raise Exception(f"The summary statistic {name} uses an unknown aggregation {aggregation}")
+
+        plan[collection].append((name, _getter(field), AGGREGATIONS[aggregation], match))
+
+    def summarize(tp):
+        summary = {}
+        for collection, entries in plan.items():
+            accumulators = [(name, getter, aggregation(match)) for name, getter, aggregation, match in entries]
+            for item in glom(tp, Coalesce(collections[collection], default=[])) or []:
+                for _, getter, update in accumulators:
+                    update(getter(item))
+
+            summary.update({name: update.result() for name, _, update in accumulators})
+
+        return summary
+
+    return summarize
@@ -0,0 +1,122 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import hashlib
+import os
+import re
+from functools import lru_cache
+from io import BytesIO
+from zipfile import ZipFile
+
+from config import TEMPLATE_CACHE_DIR
+from docxtpl import DocxTemplate
+from jinja2 import Environment, FileSystemBytecodeCache, TemplateSyntaxError, Undefined, meta
+
+DOCX_PARTS = re.compile(r"^word/(document|header\d*|footer\d*)\.xml$")
+
+
+def checksum(raw):
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+
+    return hashlib.sha256(raw).hexdigest()
+
+
+class CachedEnvironment(Environment):
+    # from_string normally compiles the source every time it is called, this environment compiles each distinct
+    # source once per process and keeps the compiled code in a bytecode cache on disk for the next run
+    def __init__(self, template_key, **options):
+        super().__init__(**options)
+        self.template_key = template_key
+        self.compiled = {}
+
+    def load_code(self, source_checksum, source):
+        bucket = None
+        if self.bytecode_cache is not None:
+            bucket = self.bytecode_cache.get_bucket(self, f"{self.template_key}:{source_checksum}", None, source)
+            if bucket.code is not None:
+                return bucket.code
+
+        code = self.compile(source)
+        if bucket is not None:
+            bucket.code = code
+            self.bytecode_cache.set_bucket(bucket)
+
+        return code
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class:
+            return super().from_string(source, globals=globals, template_class=template_class)
+
+        source_checksum = checksum(source)
+        template = self.compiled.get(source_checksum)
+        if template is None:
+            code = self.load_code(source_checksum, source)
+            template = self.template_class.from_code(self, code, self.make_globals(None), None)
+            self.compiled[source_checksum] = template
+
+        return template
+
+
+class CachedDocxTemplate(DocxTemplate):
+    # Every vendor renders the same document parts, patching the raw XML for Jinja only has to happen once
+    patched = {}
+
+    def patch_xml(self, src_xml):
+        try:
+            return self.patched[src_xml]
+        except KeyError:
+            patched = super().patch_xml(src_xml)
+            self.patched[src_xml] = patched
+            return patched
+
+
+@lru_cache(maxsize=None)
+def bytecode_cache():
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+
+@lru_cache(maxsize=None)
+def cached_environment(template_key, undefined=Undefined):
+    return CachedEnvironment(template_key, undefined=undefined, bytecode_cache=bytecode_cache())
+
+
+@lru_cache(maxsize=None)
+def read_template(filename):
+    with open(filename, "rb") as f:
+        raw = f.read()
+
+    return raw, checksum(raw)
+
+
+def load_docx_template(filename, undefined=Undefined):
+    # The docx is read from disk once per run, each vendor gets a fresh document built from the bytes in memory
+    raw, template_key = read_template(filename)
+    return CachedDocxTemplate(BytesIO(raw)), cached_environment(template_key, undefined=undefined)
+
+
+@lru_cache(maxsize=None)
+def docx_template_variables(filename):
+    # Variables referenced by the body, headers and footers of a Word template, None when the template does not parse
+    raw, template_key = read_template(filename)
+    template = CachedDocxTemplate(BytesIO(raw))
+    environment = cached_environment(template_key)
+
+    variables = set()
+    with ZipFile(BytesIO(raw)) as docx:
+        for name in [n for n in docx.namelist() if DOCX_PARTS.match(n)]:
+            xml = template.patch_xml(docx.read(name).decode("utf-8"))
+            try:
+                variables.update(meta.find_undeclared_variables(environment.parse(xml)))
+            except TemplateSyntaxError:
+                return None
+
+    return frozenset(variables)
@@ -8,13 +8,17 @@
 #
 #
 
+import json
+import os
 import re
 
 from glom import glom
-from openpyxl.cell import Cell, MergedCell
-from openpyxl.styles import PatternFill
+from openpyxl.cell import Cell, MergedCell, WriteOnlyCell
+from openpyxl.styles import Alignment, PatternFill
 from openpyxl.styles import colors
 from openpyxl.styles.fills import FILL_SOLID
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.utils import get_column_letter, quote_sheetname
 from openpyxl.utils.exceptions import IllegalCharacterError
 
 _VLOOKUP_REGEX = re.compile(r'.*?VLOOKUP\("(?P<control>\d+\.\d+\.\d+\.\d+|[A-Z]{1,3}\.\d+\.\d+\.\d+).*?".*')
@@ -28,6 +32,23 @@ def create_sheet(wb, sheet_name):
         wb.create_sheet(sheet_name)
 
 
+def load_manifest(filename):
+    if not os.path.exists(filename):
+        return {}
+
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_manifest(filename, manifest):
+    # Write a temporary file and swap it in, a crash part way through never leaves a truncated manifest behind
+    temporary_filename = f"{filename}.tmp"
+    with open(temporary_filename, "w") as f:
+        f.write(json.dumps(manifest, indent=2))
+
+    os.replace(temporary_filename, filename)
+
+
 def cell_value(cell):
     return "{}".format(cell.value).strip() if cell and cell.value else ""
 
@@ -44,7 +65,21 @@ def control_search(row):
     return found
 
 
-def sheet_writer(wb, name, columns, mapping=None, insert_controls=None):
+def header_style(cell, injector):
+    cell.font = cell.font.copy(bold=True)
+
+    if len(injector) <= 2:
+        cell.fill = PatternFill(FILL_SOLID, start_color="C9C9C9", end_color="C9C9C9")
+    elif injector[2] == "blue":
+        cell.fill = PatternFill(FILL_SOLID, start_color="0065B8", end_color="0065B8")
+        cell.font = cell.font.copy(color=colors.WHITE)
+    elif injector[2] == "orange":
+        cell.fill = PatternFill(FILL_SOLID, start_color="FFB802", end_color="FFB802")
+    else:
+        cell.fill = PatternFill(FILL_SOLID, start_color="C9C9C9", end_color="C9C9C9")
+
+
+def column_mapping(columns, mapping=None):
     if not mapping:
         mapping = {}
 
@@ -52,21 +87,17 @@ def sheet_writer(wb, name, columns, mapping=None, insert_controls=None):
         if not mapping.get(c[1], None):
             mapping[c[1]] = c[1]
 
+    return mapping
+
+
+def sheet_writer(wb, name, columns, mapping=None, insert_controls=None):
+    mapping = column_mapping(columns, mapping)
+
     def builder(sheet):
         for idx, injector in enumerate(columns):
             cell = sheet.cell(row=1, column=1 + idx)
             cell.value = injector[0]
-            cell.font = cell.font.copy(bold=True)
-
-            if len(injector) <= 2:
-                cell.fill = PatternFill(FILL_SOLID, start_color="C9C9C9", end_color="C9C9C9")
-            elif injector[2] == "blue":
-                cell.fill = PatternFill(FILL_SOLID, start_color="0065B8", end_color="0065B8")
-                cell.font = cell.font.copy(color=colors.WHITE)
-            elif injector[2] == "orange":
-                cell.fill = PatternFill(FILL_SOLID, start_color="FFB802", end_color="FFB802")
-            else:
-                cell.fill = PatternFill(FILL_SOLID, start_color="C9C9C9", end_color="C9C9C9")
+            header_style(cell, injector)
 
         def write_value(_row, _col, _val):
             cell = sheet.cell(row=_row, column=_col)
@@ -139,3 +170,93 @@ def sheet_writer(wb, name, columns, mapping=None, insert_controls=None):
         return writer
 
     return builder(wb[name])
+
+
+def copy_sheet_properties(template_sheet, sheet, max_row=None):
+    # Everything a write only sheet can carry over from a template sheet besides its cells, freeze panes, widths and
+    # heights are written with the first row so this has to be called before anything is appended
+    sheet.sheet_properties = template_sheet.sheet_properties
+    sheet.sheet_format = template_sheet.sheet_format
+    sheet.sheet_state = template_sheet.sheet_state
+    sheet.views = template_sheet.views
+    for letter, dimension in template_sheet.column_dimensions.items():
+        sheet.column_dimensions[letter].width = dimension.width
+        sheet.column_dimensions[letter].hidden = dimension.hidden
+
+    for idx, dimension in template_sheet.row_dimensions.items():
+        if max_row is None or idx <= max_row:
+            sheet.row_dimensions[idx].height = dimension.height
+            sheet.row_dimensions[idx].hidden = dimension.hidden
+
+    sheet.auto_filter = template_sheet.auto_filter
+    for merged in template_sheet.merged_cells.ranges:
+        sheet.merged_cells.add(merged.coord)
+
+    for formatting in template_sheet.conditional_formatting:
+        for rule in formatting.rules:
+            sheet.conditional_formatting.add(f"{formatting.sqref}", rule)
+
+    for validation in template_sheet.data_validations.dataValidation:
+        sheet.data_validations.append(validation)
+
+    sheet.print_options = template_sheet.print_options
+    sheet.page_margins = template_sheet.page_margins
+    if template_sheet.print_area:
+        sheet.print_area = template_sheet.print_area
+
+    # Write only sheets do not save their print titles, they are added as the defined name Excel reads them from
+    if template_sheet.print_titles:
+        titles = ",".join(f"{quote_sheetname(sheet.title)}!{t}" for t in template_sheet.print_titles.split(","))
+        index = sheet.parent.worksheets.index(sheet)
+        sheet.parent.defined_names.append(DefinedName("Print_Titles", localSheetId=index, attr_text=titles))
+
+
+def streaming_sheet_writer(wb, name, columns, mapping=None, template_sheet=None):
+    # sheet_writer for write only workbooks, rows are appended as they arrive and nothing is kept in memory
+    mapping = column_mapping(columns, mapping)
+    sheet = wb.create_sheet(name)
+    if template_sheet is not None:
+        copy_sheet_properties(template_sheet, sheet)
+
+    wrap_text = Alignment(wrap_text=True)
+
+    # Column widths have to be set before the first row is written, they are sized from the headers
+    for idx, injector in enumerate(columns):
+        sheet.column_dimensions[get_column_letter(1 + idx)].width = min(125, max(20, len(injector[0]) + 1))
+
+    header = []
+    for injector in columns:
+        cell = WriteOnlyCell(sheet, value=injector[0])
+        header_style(cell, injector)
+        header.append(cell)
+    sheet.append(header)
+
+    def write_value(_val):
+        try:
+            cell = WriteOnlyCell(sheet, value=_val)
+        except IllegalCharacterError:
+            print(f"Unable to store {_val} it contained an illegal character.")
+            cell = WriteOnlyCell(sheet, value="")
+
+        cell.alignment = wrap_text
+        return cell
+
+    def writer(blob):
+        transformed = glom(blob, mapping)
+
+        values = [transformed[injector[1]] for injector in columns]
+        multi_row = max([len(v) for v in values if isinstance(v, (list, tuple))] + [1])
+        for i in range(multi_row):
+            row = []
+            for value in values:
+                if isinstance(value, (list, tuple)):
+                    value = value[i] if i < len(value) else None
+                elif i > 0:
+                    value = None
+
+                row.append(write_value(value) if value is not None else None)
+
+            sheet.append(row)
+
+    writer.finalizer = lambda: None
+    return writer
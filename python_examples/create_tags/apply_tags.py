@@ -10,10 +10,11 @@
 
 import os
 import json
-import requests
-from openpyxl import Workbook, load_workbook
 from tqdm import tqdm
-from utils import process_companies
+from metrics import metrics_option, phase
+from profiling import profile_option
+from telemetry import session, telemetry_option
+from utils import process_companies, read_records
 from glom import glom, Coalesce
 
 import click
@@ -29,26 +30,33 @@ import click
 @click.option("--tag-header", prompt="Tags", help="Header identifying the column that contains tags", required=True)
 @click.option("--sheet", prompt="Third Parties", help="What sheet are we processing in the excel file?", required=True)
 @click.argument("filename")
+@metrics_option
+@telemetry_option
+@profile_option
 def create_tags(company_header, tag_header, sheet, filename):
     api = os.environ.get("CYBERGRX_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
     if not token:
         raise Exception("The environment variable CYBERGRX_API_TOKEN must be set")
 
-    wb = load_workbook(filename)
-    companies = process_companies(wb[sheet], {company_header: "name", tag_header: "tags"})
+    companies = process_companies(read_records(filename, {company_header: "name", tag_header: "tags"}, sheet))
 
-    print("Detected " + str(len(companies)) + " companies with tags in " + filename)
-    for company in tqdm(companies, total=len(companies), desc="Third Party Tagging"):
-        uri = api + "/v1/third-parties?limit=1&name=" + company["name"]
+    with phase("update") as count:
+        tagged = 0
+        for company in tqdm(companies, desc="Third Party Tagging"):
+            count()
+            tagged += 1
+            uri = api + "/v1/third-parties?limit=1&name=" + company["name"]
 
-        response = requests.get(uri, headers={"Authorization": token.strip()})
-        result = json.loads(response.content.decode("utf-8"))
+            response = session.get(uri, headers={"Authorization": token.strip()})
+            result = json.loads(response.content.decode("utf-8"))
 
-        third_party_id = glom(result, "items.0.id", default=None)
-        if third_party_id:
-            uri = api + "/v1/third-parties/" + third_party_id + "/tagging"
-            requests.put(uri, headers={"Authorization": token.strip()}, json={"tags": company["tags"]})
+            third_party_id = glom(result, "items.0.id", default=None)
+            if third_party_id:
+                uri = api + "/v1/third-parties/" + third_party_id + "/tagging"
+                session.put(uri, headers={"Authorization": token.strip()}, json={"tags": company["tags"]})
+
+    print("Detected " + str(tagged) + " companies with tags in " + filename)
 
 
 if __name__ == "__main__":
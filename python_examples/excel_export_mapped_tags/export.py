@@ -10,8 +10,19 @@
 
 import os
 import json
-import requests
 import click
+from control_tree import control_tree
+from gap_index import (
+    GAP_INDEX_FILE,
+    GAP_PIVOT_COLUMNS,
+    GAP_PIVOT_TABLE,
+    gap_index_writer,
+    gap_pivot_rows,
+    save_gap_index,
+)
+from metrics import metrics_option, phase
+from profiling import profile_option
+from telemetry import session, telemetry_option
 from openpyxl import Workbook
 from tqdm import tqdm
 from utils import sheet_writer
@@ -78,6 +89,14 @@ SCORE_COLUMNS = [
     ["Effectiveness Score", "effectiveness_score", "orange"],
     ["Coverage Score", "coverage_score", "orange"],
     ["Maturity Score", "maturity_score", "orange"],
+    ["Question Type", "question_type"],
+    ["Parent Number", "parent_number"],
+    ["Rollup Subcontrols", "rollup_subcontrols"],
+    ["Rollup Findings", "rollup_findings"],
+    ["Rollup High Findings", "rollup_high_findings"],
+    ["Rollup Effectiveness", "rollup_effectiveness_score"],
+    ["Rollup Coverage", "rollup_coverage_score"],
+    ["Rollup Maturity", "rollup_maturity_score"],
 ]
 
 SCORE_MAPPING = {
@@ -85,6 +104,15 @@ SCORE_MAPPING = {
     "coverage_score": Coalesce("coverage_score", default=None),
     "maturity_score": Coalesce("maturity_score", default=None),
     "answer_state": Coalesce("answer_state", default=None),
+    "question_type": Coalesce("question_type", default=None),
+    "parent_number": Coalesce("parent_number", default=None),
+    # Subcontrol scores and findings rolled up to each control and domain, see control_tree.py
+    "rollup_subcontrols": Coalesce("rollup.subcontrols", default=None),
+    "rollup_findings": Coalesce("rollup.findings", default=None),
+    "rollup_high_findings": Coalesce("rollup.high_findings", default=None),
+    "rollup_effectiveness_score": Coalesce("rollup.effectiveness_score_mean", default=None),
+    "rollup_coverage_score": Coalesce("rollup.coverage_score_mean", default=None),
+    "rollup_maturity_score": Coalesce("rollup.maturity_score_mean", default=None),
 }
 
 TAG_COLUMNS = [
@@ -95,6 +123,9 @@ TAG_COLUMNS = [
 
 @click.command()
 @click.argument("filename", required=False, default="ecosystem.xlsx")
+@metrics_option
+@telemetry_option
+@profile_option
 def export_ecosystem(filename):
     api = os.environ.get("CYBERGRX_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
@@ -103,8 +134,11 @@ def export_ecosystem(filename):
 
     uri = api + "/bulk-v1/third-parties"
     print("Fetching third parties from " + uri + " this can take some time.")
-    response = requests.get(uri, headers={"Authorization": token.strip()})
-    result = json.loads(response.content.decode("utf-8"))
+    with phase("fetch"):
+        response = session.get(uri, headers={"Authorization": token.strip()})
+    with phase("parse") as count:
+        result = json.loads(response.content.decode("utf-8"))
+        count(len(result))
 
     print("Retrieved " + str(len(result)) + " third parties from your ecosystem, building an excel.")
 
@@ -113,31 +147,51 @@ def export_ecosystem(filename):
     wb.create_sheet(GAPS_TABLE)
     wb.create_sheet(CONTROL_SCORES)
     wb.create_sheet(COMPANY_TAGS)
+    wb.create_sheet(GAP_PIVOT_TABLE)
 
     third_party_writer = sheet_writer(wb, THIRD_PARTY_TABLE, TP_COLUMNS, mapping=TP_MAPPING)
     findings_writer = sheet_writer(wb, GAPS_TABLE, GAPS_COLUMNS)
     scores_writer = sheet_writer(wb, CONTROL_SCORES, SCORE_COLUMNS, mapping=SCORE_MAPPING)
     tags_writer = sheet_writer(wb, COMPANY_TAGS, TAG_COLUMNS)
-
-    for tp in tqdm(result, total=len(result), desc="Third Party"):
-        third_party_writer(tp)
-        for tag in glom(tp, Coalesce("tags", default=[])):
-            tags_writer({"tag": tag, "company_name": tp["name"]})
-
-        for finding in glom(tp, Coalesce("residual_risk.findings", default=[])):
-            finding["company_name"] = tp["name"]
-            findings_writer(finding)
-
-        for score in glom(tp, Coalesce("residual_risk.scores", default=[])):
-            score["company_name"] = tp["name"]
-            scores_writer(score)
-
-    # Finalize each writer (fix width, ETC)
-    third_party_writer.finalizer()
-    findings_writer.finalizer()
-    scores_writer.finalizer()
-    tags_writer.finalizer()
-    wb.save("ecosystem.xlsx")
+    gap_pivot_writer = sheet_writer(wb, GAP_PIVOT_TABLE, GAP_PIVOT_COLUMNS)
+    gap_writer = gap_index_writer()
+
+    with phase("write") as count:
+        for tp in tqdm(result, total=len(result), desc="Third Party"):
+            count()
+            third_party_writer(tp)
+            for tag in glom(tp, Coalesce("tags", default=[])):
+                tags_writer({"tag": tag, "company_name": tp["name"]})
+
+            findings = glom(tp, Coalesce("residual_risk.findings", default=[]))
+            for finding in findings:
+                finding["company_name"] = tp["name"]
+                findings_writer(finding)
+                gap_writer(tp["name"], tp["id"], finding)
+
+            scores = glom(tp, Coalesce("residual_risk.scores", default=[]))
+            rollups = control_tree(scores, findings)
+            for score in scores:
+                score["company_name"] = tp["name"]
+                score["rollup"] = rollups.get(score.get("number"))
+                scores_writer(score)
+
+    with phase("finalize"):
+        # Finalize each writer (fix width, ETC)
+        third_party_writer.finalizer()
+        findings_writer.finalizer()
+        scores_writer.finalizer()
+        tags_writer.finalizer()
+
+        # Pivot the gap index, one row per control with every vendor that has a gap on it
+        gap_index = gap_writer.finalizer()
+        for row in gap_pivot_rows(gap_index):
+            gap_pivot_writer(row)
+        gap_pivot_writer.finalizer()
+        save_gap_index(GAP_INDEX_FILE, gap_index)
+
+    with phase("save"):
+        wb.save("ecosystem.xlsx")
 
 
 if __name__ == "__main__":
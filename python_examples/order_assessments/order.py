@@ -10,11 +10,12 @@
 
 import os
 import json
-import requests
-from openpyxl import Workbook, load_workbook
 from tqdm import tqdm
-from utils import process_companies
+from utils import process_companies, read_records
 from glom import glom, Coalesce, OMIT
+from metrics import metrics_option, phase
+from profiling import profile_option
+from telemetry import session, telemetry_option
 from config import HEADER_MAPPING, COMPANY_SCHEMA, GRX_COMPANY_SCHEMA
 
 import click
@@ -25,43 +26,48 @@ import click
     "--sheet", help="What sheet are we processing in the excel file?", required=False, default="Third Parties"
 )
 @click.argument("filename", required=False, default="assessment-orders.xlsx")
+@metrics_option
+@telemetry_option
+@profile_option
 def submit_orders(sheet, filename):
     api = os.environ.get("CYBERGRX_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
     if not token:
         raise Exception("The environment variable CYBERGRX_API_TOKEN must be set")
 
-    wb = load_workbook(filename)
-    work_sheet = wb[sheet] if sheet in wb else wb.active
-    companies = process_companies(work_sheet, HEADER_MAPPING, COMPANY_SCHEMA)
-
-    print("Detected " + str(len(companies)) + " companies with potential orders in " + filename)
-    print("")
+    # Each company is looked up as soon as its row has been read, the sheet is never fully loaded into memory
+    companies = []
     print("Finding all third parties in the ecosystem for order placement")
-    for company in tqdm(companies, total=len(companies), desc="Find Third Parties"):
-        company_name = company.get("name")
-        uri = api + "/v1/third-parties?limit=1&name=" + company_name
+    with phase("lookup") as count:
+        records = read_records(filename, HEADER_MAPPING, sheet)
+        for company in tqdm(process_companies(records, COMPANY_SCHEMA), desc="Find Third Parties"):
+            count()
+            companies.append(company)
+            company_name = company.get("name")
+            uri = api + "/v1/third-parties?limit=1&name=" + company_name
+
+            response = session.get(uri, headers={"Authorization": token.strip()})
+            if response.status_code is not 200:
+                print(f"There was no match for {company_name} in the ecosystem")
+                continue
 
-        response = requests.get(uri, headers={"Authorization": token.strip()})
-        if response.status_code is not 200:
-            print(f"There was no match for {company_name} in the ecosystem")
-            continue
+            try:
+                result = glom(json.loads(response.content.decode("utf-8")), "items", default=None)
+            except:
+                result = None
 
-        try:
-            result = glom(json.loads(response.content.decode("utf-8")), "items", default=None)
-        except:
-            result = None
+            if not result:
+                # print(f"There was no match for {company_name} in the ecosystem")
+                continue
 
-        if not result:
-            # print(f"There was no match for {company_name} in the ecosystem")
-            continue
+            if len(result) is not 1:
+                # print(f"There was more than 1 result for {company_name}")
+                # print(result)
+                continue
 
-        if len(result) is not 1:
-            # print(f"There was more than 1 result for {company_name}")
-            # print(result)
-            continue
+            company.update(glom(result[0], GRX_COMPANY_SCHEMA))
 
-        company.update(glom(result[0], GRX_COMPANY_SCHEMA))
+    print("\nDetected " + str(len(companies)) + " companies with potential orders in " + filename)
 
     companies_without_lookups = [c for c in companies if "url" not in c]
     if companies_without_lookups:
@@ -81,21 +87,22 @@ def submit_orders(sheet, filename):
         return
 
     print(f"\nPlacing {len(companies_without_orders)} assessment orders")
-    for company in tqdm(companies_without_orders, total=len(companies_without_orders), desc="Order Assessments"):
-        company_name = company.get("name")
-
-        uri = api + "/v1/third-parties"
-        response = requests.post(uri, headers={"Authorization": token.strip()}, json=company)
-        if response.status_code is 202:
-            print(
-                f"The order was placed for {company_name} but it is in the curation queue, must have had multiple companies with same name"
-            )
-            continue
-
-        if response.status_code is not 200:
-            print(f"There was an error processing the order for {company_name}")
-            print(response.status_code)
-            print(response.text)
+    with phase("orders", items=len(companies_without_orders)):
+        for company in tqdm(companies_without_orders, total=len(companies_without_orders), desc="Order Assessments"):
+            company_name = company.get("name")
+
+            uri = api + "/v1/third-parties"
+            response = session.post(uri, headers={"Authorization": token.strip()}, json=company)
+            if response.status_code is 202:
+                print(
+                    f"The order was placed for {company_name} but it is in the curation queue, must have had multiple companies with same name"
+                )
+                continue
+
+            if response.status_code is not 200:
+                print(f"There was an error processing the order for {company_name}")
+                print(response.status_code)
+                print(response.text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+#########################################################################
+#    _________        ___.                   ______________________  ___
+#    \_   ___ \___.__.\_ |__   ___________  /  _____/\______   \   \/  /
+#    /    \  \<   |  | | __ \_/ __ \_  __ \/   \  ___ |       _/\     /
+#    \     \___\___  | | \_\ \  ___/|  | \/\    \_\  \|    |   \/     \
+#     \______  / ____| |___  /\___  >__|    \______  /|____|_  /___/\  \
+#            \/\/          \/     \/               \/        \/      \_/
+#
+#
+
+import functools
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlsplit
+
+import click
+import requests
+
+# Requests that are rate limited (429) are retried this many times, waiting for the Retry-After the API sends back
+MAX_RETRIES = 3
+MAX_RETRY_WAIT = 60
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+PERCENTILES = [50, 95, 99]
+
+# Path segments that identify a single record are replaced so every call to the same endpoint is grouped together
+ID_SEGMENT = re.compile(
+    r"^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{24,})$"
+)
+
+_endpoints = OrderedDict()
+
+
+def reset():
+    _endpoints.clear()
+
+
+def endpoint_template(method, url):
+    parts = urlsplit(url)
+    path = "/".join("{id}" if ID_SEGMENT.match(segment) else segment for segment in parts.path.split("/"))
+    query = sorted(set(k for k, _ in parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method} {path}" + (f"?{'&'.join(query)}" if query else "")
+
+
+def _endpoint(name):
+    return _endpoints.setdefault(
+        name, {"latencies": [], "statuses": {}, "response_bytes": 0, "retries": 0, "rate_limit_wait_seconds": 0.0},
+    )
+
+
+def _response_bytes(response, stream):
+    if not stream:
+        return len(response.content or b"")
+
+    # Streamed bodies are not read here, fall back to the length the server reported
+    try:
+        return int(response.headers.get("Content-Length", 0))
+    except ValueError:
+        return 0
+
+
+def retry_after(response, attempt):
+    value = response.headers.get("Retry-After")
+    wait = None
+    if value:
+        try:
+            wait = float(value)
+        except ValueError:
+            try:
+                wait = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                wait = None
+
+    if wait is None:
+        wait = 2 ** attempt
+
+    return min(max(wait, 0), MAX_RETRY_WAIT)
+
+
+def instrument_session(session, retries=0):
+    # Wraps the session's send so every request, including ones made by an SDK that owns the session, is recorded
+    # under its endpoint template. Sessions we own also retry rate limited requests, SDKs have their own retries
+    send = session.send
+
+    def timed_send(request, **kwargs):
+        stats = _endpoint(endpoint_template(request.method, request.url))
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = send(request, **kwargs)
+            except requests.RequestException:
+                stats["latencies"].append(time.perf_counter() - start)
+                stats["statuses"]["error"] = stats["statuses"].get("error", 0) + 1
+                raise
+
+            stats["latencies"].append(time.perf_counter() - start)
+            stats["statuses"][response.status_code] = stats["statuses"].get(response.status_code, 0) + 1
+            stats["response_bytes"] += _response_bytes(response, kwargs.get("stream"))
+
+            if response.status_code != 429 or attempt >= retries:
+                return response
+
+            wait = retry_after(response, attempt)
+            stats["retries"] += 1
+            stats["rate_limit_wait_seconds"] += wait
+            # The retried response is dropped, close it so a streamed one gives its connection back to the pool
+            response.close()
+            time.sleep(wait)
+            attempt += 1
+
+    session.send = timed_send
+    return session
+
+
+# Shared by every request the example makes, it also keeps connections to the API open between requests
+session = instrument_session(requests.Session(), retries=MAX_RETRIES)
+
+
+def _percentile(ordered, p):
+    # Nearest rank on the sorted latencies
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] if ordered else None
+
+
+def summary():
+    endpoints = OrderedDict()
+    for name, stats in _endpoints.items():
+        ordered = sorted(stats["latencies"])
+        endpoints[name] = {
+            "requests": len(ordered),
+            "latency_seconds": {
+                **{f"p{p}": _percentile(ordered, p) for p in PERCENTILES},
+                "mean": sum(ordered) / len(ordered) if ordered else None,
+                "max": ordered[-1] if ordered else None,
+            },
+            "latency_histogram": OrderedDict(
+                [(f"le_{b}", len([l for l in ordered if l <= b])) for b in LATENCY_BUCKETS]
+                + [("le_inf", len(ordered))]
+            ),
+            "statuses": {f"{k}": v for k, v in stats["statuses"].items()},
+            "response_bytes": stats["response_bytes"],
+            "retries": stats["retries"],
+            "rate_limit_wait_seconds": stats["rate_limit_wait_seconds"],
+        }
+
+    return endpoints
+
+
+def _label(value):
+    return f"{value}".replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(value):
+    return "NaN" if value is None else f"{value}"
+
+
+PROMETHEUS_COUNTERS = [
+    ["cybergrx_http_response_bytes_total", "Bytes received by endpoint", "response_bytes"],
+    ["cybergrx_http_retries_total", "Rate limited requests that were retried by endpoint", "retries"],
+    [
+        "cybergrx_http_rate_limit_wait_seconds_total",
+        "Time spent waiting on rate limits by endpoint",
+        "rate_limit_wait_seconds",
+    ],
+]
+
+
+def prometheus_text():
+    endpoints = summary()
+
+    metric = "cybergrx_http_request_duration_seconds"
+    lines = [f"# HELP {metric} Latency of HTTP requests by endpoint", f"# TYPE {metric} summary"]
+    for name, stats in endpoints.items():
+        endpoint = _label(name)
+        for p in PERCENTILES:
+            value = _sample(stats["latency_seconds"][f"p{p}"])
+            lines.append(f'{metric}{{endpoint="{endpoint}",quantile="{p / 100}"}} {value}')
+        lines.append(f'{metric}_sum{{endpoint="{endpoint}"}} {sum(_endpoints[name]["latencies"])}')
+        lines.append(f'{metric}_count{{endpoint="{endpoint}"}} {stats["requests"]}')
+
+    metric = "cybergrx_http_responses_total"
+    lines.extend([f"# HELP {metric} HTTP responses by endpoint and status code", f"# TYPE {metric} counter"])
+    for name, stats in endpoints.items():
+        for status, count in stats["statuses"].items():
+            lines.append(f'{metric}{{endpoint="{_label(name)}",status="{_label(status)}"}} {count}')
+
+    for metric, description, key in PROMETHEUS_COUNTERS:
+        lines.extend([f"# HELP {metric} {description}", f"# TYPE {metric} counter"])
+        for name, stats in endpoints.items():
+            lines.append(f'{metric}{{endpoint="{_label(name)}"}} {stats[key]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def save_telemetry(filename):
+    # A .prom file is written in the Prometheus text format for the node exporter textfile collector, anything else
+    # is written as JSON
+    with open(filename, "w") as f:
+        if filename.endswith(".prom"):
+            f.write(prometheus_text())
+        else:
+            f.write(json.dumps({"endpoints": summary()}, indent=2))
+
+
+def telemetry_option(command):
+    # Adds --telemetry-out to a click command, the HTTP telemetry is written when the command exits
+    @click.option(
+        "--telemetry-out",
+        help="Write per endpoint HTTP latency, status, byte and retry counts to this file, .prom for Prometheus",
+        required=False,
+    )
+    @functools.wraps(command)
+    def wrapper(*args, telemetry_out=None, **kwargs):
+        reset()
+        try:
+            return command(*args, **kwargs)
+        finally:
+            if telemetry_out:
+                save_telemetry(telemetry_out)
+
+    return wrapper
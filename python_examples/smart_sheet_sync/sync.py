@@ -11,15 +11,17 @@
 import os
 import re
 import json
-import requests
 import smartsheet
 import stringcase
+from multiprocessing import Pool
 from datetime import datetime, timedelta
 from openpyxl import Workbook, load_workbook
 from tqdm import tqdm
 from utils import (
     split,
     normalize_vendor,
+    normalize_record,
+    row_record,
     lookup_sheet_id,
     skip_falsy,
     insert_http,
@@ -27,11 +29,37 @@ from utils import (
     sheet_writer,
     row_to_vendor,
 )
+from metrics import metrics_option, phase
+from profiling import profile_option
+from telemetry import instrument_session, session, telemetry_option
 from config import HEADER_MAPPING, SMART_SHEET_UPDATE_COLUMNS, COMPANY_SCHEMA, GRX_COMPANY_SCHEMA, BULK_IMPORT_COLUMNS
 from glom import glom, Coalesce, OMIT
 
 import click
 
+_worker_header_mapping = None
+
+
+def init_normalize_worker(header_mapping):
+    # The header mapping is built from the sheet's columns at runtime, each worker receives it once when it starts
+    global _worker_header_mapping
+    _worker_header_mapping = header_mapping
+
+
+def normalize_record_worker(record):
+    return normalize_record(record, _worker_header_mapping, COMPANY_SCHEMA)
+
+
+def normalize_vendors(rows, workers):
+    if workers <= 1:
+        return [normalize_vendor(vendor, HEADER_MAPPING, COMPANY_SCHEMA) for vendor in rows]
+
+    # Rows are sent to the pool in chunks, map keeps them in sheet order
+    records = [row_record(row) for row in rows]
+    chunksize = max(1, min(500, len(records) // (workers * 4)))
+    with Pool(workers, initializer=init_normalize_worker, initargs=(HEADER_MAPPING,)) as pool:
+        return pool.map(normalize_record_worker, records, chunksize=chunksize)
+
 
 def process_newly_matched_vendor(missing, matches, token, api):
     if glom(matches, "0.custom_id", default=None):
@@ -40,7 +68,7 @@ def process_newly_matched_vendor(missing, matches, token, api):
 
     # Found one company in CyberGRX that does not have a custom_id, link these records up
     uri = api + glom(matches, "0.uri") + "/custom-id"
-    response = requests.put(uri, headers={"Authorization": token.strip()}, json={"custom_id": missing["custom_id"]})
+    response = session.put(uri, headers={"Authorization": token.strip()}, json={"custom_id": missing["custom_id"]})
     if response.status_code != 200:
         print("Error submitting custom_id for " + missing["name"])
         print(response.content)
@@ -48,7 +76,7 @@ def process_newly_matched_vendor(missing, matches, token, api):
     if "custom_metadata" in missing:
         # Apply custom metadata
         uri = api + glom(matches, "0.uri") + "/custom-metadata"
-        response = requests.patch(
+        response = session.patch(
             uri,
             headers={"Authorization": token.strip(), "Content-Type": "application/merge-patch+json"},
             json=missing["custom_metadata"],
@@ -69,7 +97,7 @@ def process_missing_vendors(missing_vendors, skip_rows_without_orders, token, ap
 
     for missing in tqdm(missing_vendors, total=len(missing_vendors), desc="Create missing vendors"):
         uri = api + "/v1/third-parties?name=" + missing["name"]
-        response = requests.get(uri, headers={"Authorization": token.strip()})
+        response = session.get(uri, headers={"Authorization": token.strip()})
         if response.status_code not in [200]:
             print("Error looking up third party by name " + missing["name"])
             print(response.content)
@@ -84,7 +112,7 @@ def process_missing_vendors(missing_vendors, skip_rows_without_orders, token, ap
                 domain = domain.split("://", 1)[1]
 
             uri = api + "/v1/third-parties?domain=" + domain
-            response = requests.get(uri, headers={"Authorization": token.strip()})
+            response = session.get(uri, headers={"Authorization": token.strip()})
             if response.status_code not in [200]:
                 print("Error looking up third party by url " + missing["url"])
                 print(response.content)
@@ -113,7 +141,7 @@ def process_missing_vendors(missing_vendors, skip_rows_without_orders, token, ap
                 continue
 
             uri = api + "/v1/third-parties"
-            response = requests.post(uri, headers={"Authorization": token.strip()}, json=missing)
+            response = session.post(uri, headers={"Authorization": token.strip()}, json=missing)
             if response.status_code not in [200, 202]:
                 print("Error submitting GRX vendor request for " + missing["name"])
                 print(response.content)
@@ -138,7 +166,7 @@ def apply_scoping_profile(third_party_id, third_party_name, scoping_profile, tok
         return
 
     uri = api + "/v1/third-parties/" + third_party_id + "/scoping"
-    response = requests.put(uri, headers={"Authorization": token.strip()}, json=scoping_profile)
+    response = session.put(uri, headers={"Authorization": token.strip()}, json=scoping_profile)
     if response.status_code != 200:
         print("Error submitting scoping profile answers for " + third_party_name)
         print(response.content)
@@ -174,6 +202,16 @@ def process_matched_vendors(matched_vendors, token, sheet_id, api, smart):
     smart.Sheets.update_rows(sheet_id, row_updates)
 
 
+def smartsheet_client():
+    # SMARTSHEET_API_BASE points the SDK at another Smartsheet API, such as the stand-in in ../benchmarks
+    api_base = os.environ.get("SMARTSHEET_API_BASE", None)
+    smart = smartsheet.Smartsheet(api_base=api_base.rstrip("/")) if api_base else smartsheet.Smartsheet()
+    smart.errors_as_exceptions(True)
+    # Smartsheet calls are recorded with the CyberGRX ones, the SDK retries its own rate limited requests
+    instrument_session(smart._session)
+    return smart
+
+
 @click.command()
 @click.option("--sheet-name", help="Name of the sheet we are using", required=False)
 @click.option("--sheet-id", help="ID of the sheet we are using", required=False)
@@ -182,7 +220,13 @@ def process_matched_vendors(matched_vendors, token, sheet_id, api, smart):
     help="Do not submit rows to CyberGRX that do not have a valid 'Order Assessment Tier'",
     is_flag=True,
 )
-def sync_smart_sheet(sheet_name, sheet_id, skip_rows_without_orders):
+@click.option(
+    "--workers", help="Normalize sheet rows in a pool of this many processes", default=1, type=int,
+)
+@metrics_option
+@telemetry_option
+@profile_option
+def sync_smart_sheet(sheet_name, sheet_id, skip_rows_without_orders, workers):
     api = os.environ.get("CYBERGRX_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
     if not token:
@@ -194,15 +238,16 @@ def sync_smart_sheet(sheet_name, sheet_id, skip_rows_without_orders):
     if not sheet_id and not sheet_name:
         raise Exception("Either --sheet-name or --sheet-id must be provided")
 
-    smart = smartsheet.Smartsheet()
-    smart.errors_as_exceptions(True)
+    smart = smartsheet_client()
 
-    # If sheet_id was not provided, lookup the ID using the sheet name
-    if not sheet_id:
-        sheet_id = lookup_sheet_id(smart, sheet_name)
+    with phase("sheet") as count:
+        # If sheet_id was not provided, lookup the ID using the sheet name
+        if not sheet_id:
+            sheet_id = lookup_sheet_id(smart, sheet_name)
 
-    # Load the entire sheet
-    sheet = smart.Sheets.get_sheet(sheet_id)
+        # Load the entire sheet
+        sheet = smart.Sheets.get_sheet(sheet_id)
+        count(len(sheet.rows))
     print("Loaded " + str(len(sheet.rows)) + " vendors from sheet: " + sheet.name)
 
     # Build column map for later reference - translates column names to smart sheet column ids
@@ -216,7 +261,8 @@ def sync_smart_sheet(sheet_name, sheet_id, skip_rows_without_orders):
             HEADER_MAPPING[snake_header] = column.id
 
     # Load all vendors from smart sheet
-    all_smart_sheet_vendors = [normalize_vendor(vendor, HEADER_MAPPING, COMPANY_SCHEMA) for vendor in sheet.rows]
+    with phase("transform", items=len(sheet.rows)):
+        all_smart_sheet_vendors = normalize_vendors(sheet.rows, workers)
 
     # Report any records that are missing data
     for v in all_smart_sheet_vendors:
@@ -229,16 +275,20 @@ def sync_smart_sheet(sheet_name, sheet_id, skip_rows_without_orders):
     # Load all third parties skipping residual risk
     uri = api + "/bulk-v1/third-parties"
     print("Fetching third parties from " + uri + " this can take some time.")
-    response = requests.get(uri, headers={"Authorization": token.strip()})
+    with phase("fetch"):
+        response = session.get(uri, headers={"Authorization": token.strip()})
 
-    grx_vendors = glom(json.loads(response.content.decode("utf-8")), ([GRX_COMPANY_SCHEMA]))
+    with phase("parse") as count:
+        grx_vendors = glom(json.loads(response.content.decode("utf-8")), ([GRX_COMPANY_SCHEMA]))
+        count(len(grx_vendors))
     grx_custom_ids = set([v["custom_id"] for v in grx_vendors if v["custom_id"]])
 
     # See which vendors in smart sheets do not have a corresponding custom_id in CyberGRX
     missing_vendors = [vendor for vendor in smart_sheet_vendors if vendor["custom_id"] not in grx_custom_ids]
     if missing_vendors:
         print("There are vendors in smart sheet that need to be migrated to CyberGRX")
-        process_missing_vendors(missing_vendors, skip_rows_without_orders, token, api, sheet_id, smart)
+        with phase("create vendors", items=len(missing_vendors)):
+            process_missing_vendors(missing_vendors, skip_rows_without_orders, token, api, sheet_id, smart)
 
     # Associate smart sheet vendors with CyberGRX records
     grx_vendor_map = {vendor["custom_id"]: vendor for vendor in grx_vendors}
@@ -250,12 +300,14 @@ def sync_smart_sheet(sheet_name, sheet_id, skip_rows_without_orders):
     vendors_with_profile = [vendor for vendor in matched_vendors if not vendor["grx"]["is_profile_complete"]]
     if vendors_with_profile:
         print("There are vendors with profile questions that need to be answered in CyberGRX")
-        process_vendors_with_profile_updates(vendors_with_profile, token, api)
+        with phase("profile updates", items=len(vendors_with_profile)):
+            process_vendors_with_profile_updates(vendors_with_profile, token, api)
 
     # For vendors that have matches, sync their risk back to smart sheets
     if matched_vendors:
         print("There are vendors that need to sync risk profiles back to smart sheets")
-        process_matched_vendors(matched_vendors, token, sheet_id, api, smart)
+        with phase("risk updates", items=len(matched_vendors)):
+            process_matched_vendors(matched_vendors, token, sheet_id, api, smart)
 
 
 @click.command()
@@ -266,6 +318,9 @@ def sync_smart_sheet(sheet_name, sheet_id, skip_rows_without_orders):
     help="Do not submit rows to CyberGRX that do not have a valid 'Order Assessment Tier'",
     is_flag=True,
 )
+@metrics_option
+@telemetry_option
+@profile_option
 def bulk_import_request(sheet_name, sheet_id, skip_rows_without_orders):
     api = os.environ.get("CYBERGRX_API", "https://api.cybergrx.com").rstrip("/")
     token = os.environ.get("CYBERGRX_API_TOKEN", None)
@@ -278,15 +333,16 @@ def bulk_import_request(sheet_name, sheet_id, skip_rows_without_orders):
     if not sheet_id and not sheet_name:
         raise Exception("Either --sheet-name or --sheet-id must be provided")
 
-    smart = smartsheet.Smartsheet()
-    smart.errors_as_exceptions(True)
+    smart = smartsheet_client()
 
-    # If sheet_id was not provided, lookup the ID using the sheet name
-    if not sheet_id:
-        sheet_id = lookup_sheet_id(smart, sheet_name)
+    with phase("sheet") as count:
+        # If sheet_id was not provided, lookup the ID using the sheet name
+        if not sheet_id:
+            sheet_id = lookup_sheet_id(smart, sheet_name)
 
-    # Load the entire sheet
-    sheet = smart.Sheets.get_sheet(sheet_id)
+        # Load the entire sheet
+        sheet = smart.Sheets.get_sheet(sheet_id)
+        count(len(sheet.rows))
     print("Loaded " + str(len(sheet.rows)) + " vendors from sheet: " + sheet.name)
 
     # Build column map for later reference - translates column names to smart sheet column ids
@@ -300,13 +356,17 @@ def bulk_import_request(sheet_name, sheet_id, skip_rows_without_orders):
             HEADER_MAPPING[snake_header] = column.id
 
     # Load all vendors from smart sheet
-    smart_sheet_vendors = [row_to_vendor(vendor, HEADER_MAPPING) for vendor in sheet.rows]
+    with phase("transform", items=len(sheet.rows)):
+        smart_sheet_vendors = [row_to_vendor(vendor, HEADER_MAPPING) for vendor in sheet.rows]
 
     # Load all third parties skipping residual risk
     uri = api + "/bulk-v1/third-parties?skip_residual_risk=true"
     print("Fetching third parties from " + uri + " this can take some time.")
-    response = requests.get(uri, headers={"Authorization": token.strip()})
-    grx_vendors = glom(json.loads(response.content.decode("utf-8")), ([GRX_COMPANY_SCHEMA]))
+    with phase("fetch"):
+        response = session.get(uri, headers={"Authorization": token.strip()})
+    with phase("parse") as count:
+        grx_vendors = glom(json.loads(response.content.decode("utf-8")), ([GRX_COMPANY_SCHEMA]))
+        count(len(grx_vendors))
     grx_custom_ids = set([v["custom_id"] for v in grx_vendors if v["custom_id"]])
 
     # See which vendors in smart sheets do not have a corresponding custom_id in CyberGRX
@@ -324,12 +384,15 @@ def bulk_import_request(sheet_name, sheet_id, skip_rows_without_orders):
     wb["Sheet"].title = "Third Party Information"
     vendor_writer = sheet_writer(wb, "Third Party Information", BULK_IMPORT_COLUMNS)
 
-    for vendor in tqdm(missing_vendors, total=len(missing_vendors), desc="Vendor"):
-        vendor_writer(vendor)
+    with phase("write", items=len(missing_vendors)):
+        for vendor in tqdm(missing_vendors, total=len(missing_vendors), desc="Vendor"):
+            vendor_writer(vendor)
+
+        # Finalize each writer (fix width, ETC)
+        vendor_writer.finalizer()
 
-    # Finalize each writer (fix width, ETC)
-    vendor_writer.finalizer()
-    wb.save("bulk-import-request.xlsx")
+    with phase("save"):
+        wb.save("bulk-import-request.xlsx")
 
 
 @click.group()
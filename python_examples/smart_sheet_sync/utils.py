@@ -9,9 +9,11 @@
 #
 
 import os
+import re
 import json
 import requests
 from datetime import datetime
+from functools import lru_cache
 from collections import OrderedDict
 from email_validator import validate_email, EmailNotValidError
 from openpyxl import Workbook
@@ -23,6 +25,9 @@ from tqdm import tqdm
 from glom import glom, OMIT, GlomError
 
 
+# A quick shape check before the full validator, the local part may be empty to match allow_empty_local
+EMAIL_PREFILTER = re.compile(r"^[^@\s]*@[^@\s]+\.[^@\s]+$")
+
 VALID_ANSWERS = {
     "least": "Least",
     "minimal": "Minimal",
@@ -61,14 +66,28 @@ def insert_http(value):
     return value
 
 
-def row_to_vendor(row, column_mapping):
-    vendor = {column_mapping[cell.column_id]: cell.value for cell in row.cells}
-    vendor["custom_id"] = str(row.id)
+def row_record(row):
+    # SDK rows reference the client that loaded them, a record of plain (column id, value) pairs can be pickled
+    return str(row.id), [(cell.column_id, cell.value) for cell in row.cells]
+
+
+def record_to_vendor(record, column_mapping):
+    custom_id, cells = record
+    vendor = {column_mapping[column_id]: value for column_id, value in cells}
+    vendor["custom_id"] = custom_id
     return vendor
 
 
+def row_to_vendor(row, column_mapping):
+    return record_to_vendor(row_record(row), column_mapping)
+
+
 def normalize_vendor(row, column_mapping, spec):
-    vendor = glom(row_to_vendor(row, column_mapping), spec)
+    return normalize_record(row_record(row), column_mapping, spec)
+
+
+def normalize_record(record, column_mapping, spec):
+    vendor = glom(record_to_vendor(record, column_mapping), spec)
 
     # Check that vendor record for accuracy
     if "url" not in vendor:
@@ -118,6 +137,20 @@ def split(last, spliton=" "):
     return parser
 
 
+@lru_cache(maxsize=16384)
+def parse_email(value):
+    # The schema pulls the first name, last name and domain from the same address, each address is validated once
+    # and the result (or the validation error) is shared by every selector
+    if not isinstance(value, str) or not EMAIL_PREFILTER.match(value):
+        return None, f"{value} is not an email address"
+
+    try:
+        parsed = validate_email(value, check_deliverability=False, allow_empty_local=True)
+        return (parsed["local"], parsed["domain"]), None
+    except EmailNotValidError as e:
+        return None, str(e)
+
+
 def email_metadata(selector):
     first_name = split(False, ".")
     last_name = split(True, ".")
@@ -126,17 +159,15 @@ def email_metadata(selector):
         if not value:
             raise GlomError("Value was not defined")
 
-        try:
-            parsed = validate_email(value, check_deliverability=False, allow_empty_local=True)
+        parsed, error = parse_email(value)
+        if error:
+            raise GlomError(error)
 
-            if selector == "domain":
-                return parsed["domain"]
+        local, domain = parsed
+        if selector == "domain":
+            return domain
 
-            return (
-                first_name(parsed["local"]) if selector == "first_name" else last_name(parsed["local"])
-            ).capitalize()
-        except EmailNotValidError as e:
-            raise GlomError(str(e))
+        return (first_name(local) if selector == "first_name" else last_name(local)).capitalize()
 
     return parser
 